@@ -0,0 +1,150 @@
+import csv
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import pubchem
+
+CHECKPOINT_DIR = os.getenv("BATCH_CHECKPOINT_DIR", os.path.join(".cache", "batches"))
+
+COLUMNS = ['query', 'cid', *pubchem.PROPERTY_FIELDS.values(), 'error']
+
+NOT_FOUND = "not found"
+
+_SMILES_CHARS = re.compile(r"^[A-Za-z0-9@+\-\[\]\(\)=#$%/\\.:*]+$")
+_SMILES_MARKERS = set("=#()[]@+/\\0123456789")
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="batch-lookup")
+
+
+# Whether RDKit reads the text as a molecule; False when RDKit is unavailable
+def _parses_as_smiles(text):
+    try:
+        from rdkit import Chem
+        from rdkit.rdBase import BlockLogs
+
+        _block = BlockLogs()
+        return Chem.MolFromSmiles(text) is not None
+    except Exception:
+        return False
+
+
+# Guess whether an identifier is a CID, a SMILES string or a compound name.
+# Text without SMILES markers (CCO, but also EDTA or DMSO) only counts as
+# SMILES when RDKit can parse it.
+def classify_identifier(text):
+    if text.isdigit():
+        return 'cid'
+    if _SMILES_CHARS.match(text) and (_SMILES_MARKERS.intersection(text) or _parses_as_smiles(text)):
+        return 'smiles'
+    return 'name'
+
+
+# Strip blanks and duplicates while keeping the order the user gave
+def clean_identifiers(lines):
+    seen = set()
+    identifiers = []
+    for line in lines:
+        identifier = str(line).strip()
+        if identifier and identifier not in seen:
+            seen.add(identifier)
+            identifiers.append(identifier)
+    return identifiers
+
+
+# Rows already resolved for one input list, kept on disk so a batch can resume
+class BatchCheckpoint:
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def for_input(cls, identifiers, kind):
+        digest = hashlib.sha1("\n".join([kind, *identifiers]).encode("utf-8")).hexdigest()
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        return cls(os.path.join(CHECKPOINT_DIR, f"{digest}.csv"))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.read_csv(
+            self.path,
+            dtype={'query': str, 'cid': 'Int64'},
+            keep_default_na=False,
+            na_values={'cid': ['']},
+        )
+
+    def completed(self):
+        return set(self.load()['query'])
+
+    # Only definitive answers are recorded; transient failures are retried on resume
+    def append(self, rows):
+        rows = [row for row in rows if row['error'] in ('', NOT_FOUND)]
+        if not rows:
+            return
+        is_new = not os.path.exists(self.path)
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            if is_new:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+def _resolve(identifier, kind):
+    try:
+        cid = pubchem.resolve_cid(identifier, kind)
+        return cid, '' if cid else NOT_FOUND
+    except Exception as e:
+        return None, str(e)
+
+
+# Identifiers only guessed to be SMILES are retried as names when the
+# SMILES lookup finds nothing or fails
+def _resolve_guessed(identifier):
+    kind = classify_identifier(identifier)
+    cid, error = _resolve(identifier, kind)
+    if error and kind == 'smiles':
+        return _resolve(identifier, 'name')
+    return cid, error
+
+
+# Resolve one chunk: identifiers to CIDs, then a single property-table request
+def lookup_chunk(identifiers, kind='auto'):
+    if kind == 'auto':
+        resolved = list(_executor.map(_resolve_guessed, identifiers))
+    else:
+        resolved = list(_executor.map(_resolve, identifiers, [kind] * len(identifiers)))
+
+    cids = sorted({cid for cid, _ in resolved if cid})
+    try:
+        properties = pubchem.fetch_properties(cids)
+        batch_error = ''
+    except Exception as e:
+        properties = {}
+        batch_error = str(e)
+
+    rows = []
+    for identifier, (cid, error) in zip(identifiers, resolved):
+        row = dict.fromkeys(COLUMNS, 'N/A')
+        row.update({'query': identifier, 'cid': cid, 'error': error})
+        if cid and not error:
+            if cid in properties:
+                row.update(properties[cid])
+            else:
+                row['error'] = batch_error or NOT_FOUND
+        rows.append(row)
+    return rows
+
+
+# Yield one DataFrame per chunk, skipping identifiers a checkpoint already holds
+def iter_batch_lookup(identifiers, kind='auto', chunk_size=pubchem.BATCH_SIZE, checkpoint=None):
+    done = checkpoint.completed() if checkpoint else set()
+    pending = [identifier for identifier in identifiers if identifier not in done]
+
+    for start in range(0, len(pending), chunk_size):
+        rows = lookup_chunk(pending[start:start + chunk_size], kind)
+        if checkpoint:
+            checkpoint.append(rows)
+        yield pd.DataFrame(rows, columns=COLUMNS)
@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+from urllib.parse import quote
+
+from rdkit import Chem
+from rdkit.Chem import AllChem, Crippen, Descriptors, rdMolDescriptors
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_server import RecordingStore
+
+# The Quick Access compounds, with the CIDs and names PubChem uses for them
+COMPOUNDS = [
+    ("aspirin", 2244, "CC(=O)OC1=CC=CC=C1C(=O)O", "2-acetyloxybenzoic acid"),
+    ("caffeine", 2519, "CN1C=NC2=C1C(=O)N(C(=O)N2C)C", "1,3,7-trimethylpurine-2,6-dione"),
+    ("glucose", 5793, "C(C1C(C(C(C(O1)O)O)O)O)O", "6-(hydroxymethyl)oxane-2,3,4,5-tetrol"),
+    ("water", 962, "O", "oxidane"),
+    ("ethanol", 702, "CCO", "ethanol"),
+]
+
+
+def _prop(label, value, name=None, implementation=None):
+    urn = {'label': label}
+    if name:
+        urn['name'] = name
+    if implementation:
+        urn['implementation'] = implementation
+    kind = 'sval' if isinstance(value, str) else 'ival' if isinstance(value, int) else 'fval'
+    return {'urn': urn, 'value': {kind: value}}
+
+
+# A PC_Compounds record shaped like PubChem's, with properties computed by RDKit
+def compound_record(cid, smiles, iupac):
+    mol = Chem.MolFromSmiles(smiles)
+    with_hs = Chem.AddHs(mol)
+    AllChem.Compute2DCoords(with_hs)
+    positions = with_hs.GetConformer().GetPositions()
+    aids = [atom.GetIdx() + 1 for atom in with_hs.GetAtoms()]
+
+    return {
+        'id': {'id': {'cid': cid}},
+        'atoms': {'aid': aids, 'element': [atom.GetAtomicNum() for atom in with_hs.GetAtoms()]},
+        'bonds': {
+            'aid1': [bond.GetBeginAtomIdx() + 1 for bond in with_hs.GetBonds()],
+            'aid2': [bond.GetEndAtomIdx() + 1 for bond in with_hs.GetBonds()],
+            'order': [int(bond.GetBondTypeAsDouble()) for bond in with_hs.GetBonds()],
+        },
+        'coords': [{
+            'type': [1, 5, 255],
+            'aid': aids,
+            'conformers': [{'x': positions[:, 0].tolist(), 'y': positions[:, 1].tolist()}],
+        }],
+        'props': [
+            _prop("IUPAC Name", iupac, name="Preferred"),
+            _prop("InChI", Chem.MolToInchi(mol), name="Standard"),
+            _prop("InChIKey", Chem.MolToInchiKey(mol), name="Standard"),
+            _prop("Log P", round(Crippen.MolLogP(mol), 1), name="XLogP3"),
+            _prop("Molecular Formula", rdMolDescriptors.CalcMolFormula(mol)),
+            _prop("Molecular Weight", f"{Descriptors.MolWt(mol):.2f}"),
+            _prop("SMILES", smiles, name="Connectivity"),
+            _prop("SMILES", smiles, name="Canonical"),
+            _prop("Topological", round(rdMolDescriptors.CalcTPSA(mol), 1),
+                  name="Polar Surface Area", implementation="E_TPSA"),
+            _prop("Compound Complexity", float(mol.GetNumHeavyAtoms() * 10), implementation="E_COMPLEXITY"),
+            _prop("Count", rdMolDescriptors.CalcNumHBD(mol), name="Hydrogen Bond Donor", implementation="E_NHDONORS"),
+            _prop("Count", rdMolDescriptors.CalcNumHBA(mol), name="Hydrogen Bond Acceptor", implementation="E_NHACCEPTORS"),
+            _prop("Count", rdMolDescriptors.CalcNumRotatableBonds(mol), name="Rotatable Bond", implementation="E_NROTBONDS"),
+        ],
+    }
+
+
+def conformer_sdf(cid, smiles):
+    mol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+    AllChem.EmbedMolecule(mol, randomSeed=0xf00d)
+    AllChem.MMFFOptimizeMolecule(mol)
+    mol.SetProp("_Name", str(cid))
+    return Chem.MolToMolBlock(mol) + "$$$$\n"
+
+
+# Write stand-in recordings for the Quick Access compounds. Real responses
+# can replace them by running stub_server.py --record against live PubChem.
+def main():
+    store = RecordingStore()
+    for name, cid, smiles, iupac in COMPOUNDS:
+        body = json.dumps({'PC_Compounds': [compound_record(cid, smiles, iupac)]}).encode("utf-8")
+        store.put("GET", f"/rest/pug/compound/name/{quote(name, safe='')}/JSON", b"", 200, "application/json", body)
+        store.put("GET", f"/rest/pug/compound/name/{quote(name, safe='')}/cids/TXT", b"", 200, "text/plain", f"{cid}\n".encode())
+        store.put("GET", f"/rest/pug/compound/cid/{cid}/SDF?record_type=3d", b"", 200,
+                  "chemical/x-mdl-sdfile", conformer_sdf(cid, smiles).encode("utf-8"))
+    print(f"Wrote recordings for {len(COMPOUNDS)} compounds to {store.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "streamlit_app.py")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from stub_server import StubServer
+
+SEARCHES = ["aspirin", "caffeine", "glucose", "water", "ethanol"]
+
+# A Ketcher-style Mol block for the draw-tab scenario (paracetamol)
+KETCHER_SMILES = "CC(=O)Nc1ccc(O)cc1"
+
+# Slowdown always allowed, so sub-millisecond scenarios do not fail on timer noise
+MIN_SLACK_MS = 2.0
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Benchmark:
+    def __init__(self, iterations, stub):
+        self.iterations = iterations
+        self.stub = stub
+        self.results = {}
+
+    # Run one scenario, recording latency, upstream requests and peak Python memory
+    def measure(self, name, step, setup=None):
+        samples = []
+        requests_before = self.stub.request_count
+        tracemalloc.reset_peak()
+        for i in range(self.iterations):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            step(i)
+            samples.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+
+        self.results[name] = {
+            'iterations': len(samples),
+            'p50_ms': round(1000 * percentile(samples, 0.50), 2),
+            'p95_ms': round(1000 * percentile(samples, 0.95), 2),
+            'p99_ms': round(1000 * percentile(samples, 0.99), 2),
+            'mean_ms': round(1000 * statistics.mean(samples), 2),
+            'requests': self.stub.request_count - requests_before,
+            'peak_memory_kb': round(peak / 1024),
+        }
+        print(f"{name:20} p50 {self.results[name]['p50_ms']:>9} ms   "
+              f"p95 {self.results[name]['p95_ms']:>9} ms   "
+              f"requests {self.results[name]['requests']:>4}   "
+              f"peak {self.results[name]['peak_memory_kb']:>7} KiB")
+
+
+# Point every cache and PubChem itself at throwaway local state, before the app is imported
+def isolate_environment(workdir, stub):
+    os.environ.pop("DB_URL", None)
+    # A shared tier filled by other processes would make cold runs warm
+    os.environ.pop("SHARED_CACHE", None)
+    os.environ.update({
+        'PUBCHEM_BASE_URL': stub.base_url,
+        # The benchmark measures the app, not the politeness throttle
+        'PUBCHEM_RATE_LIMIT': "1000",
+        # Cold scenarios must stay cold
+        'WARMUP_ON_START': "0",
+        'COMPOUND_CACHE_PATH': os.path.join(workdir, "compounds.sqlite3"),
+        'BATCH_CHECKPOINT_DIR': os.path.join(workdir, "batches"),
+        'DEPICTION_CACHE_DIR': os.path.join(workdir, "depictions"),
+        'CONFORMER_CACHE_DIR': os.path.join(workdir, "conformers"),
+        'SIMILARITY_INDEX_DIR': os.path.join(workdir, "similarity"),
+        'SYNONYM_INDEX_DIR': os.path.join(workdir, "synonyms"),
+    })
+
+
+def reset_caches(workdir):
+    import streamlit as st
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    for entry in os.listdir(workdir):
+        path = os.path.join(workdir, entry)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def run_scenarios(iterations, workdir, stub):
+    from streamlit.testing.v1 import AppTest
+    from rdkit import Chem
+
+    import depiction
+    import descriptor_engine
+    from core import MoleculeService
+
+    bench = Benchmark(iterations, stub)
+
+    def initial_render(i):
+        at = AppTest.from_file(APP_PATH, default_timeout=60)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    def search(i):
+        at = AppTest.from_file(APP_PATH, default_timeout=60)
+        at.run()
+        at.text_input[0].set_value(SEARCHES[i % len(SEARCHES)]).run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    # Pay module imports once so cold searches measure the pipeline, not the interpreter
+    initial_render(0)
+
+    bench.measure("cold_search", search, setup=lambda: reset_caches(workdir))
+    for i in range(len(SEARCHES)):
+        search(i)
+    bench.measure("warm_search", search)
+    bench.measure("history_render", initial_render)
+
+    # The lookup pipeline on its own, without AppTest's script overhead, so
+    # pipeline regressions are not lost in the noise of a full rerun
+    service = None
+
+    def fresh_service():
+        nonlocal service
+        reset_caches(workdir)
+        service = MoleculeService.from_env()
+
+    def lookup(i):
+        if not service.lookup(SEARCHES[i % len(SEARCHES)]):
+            raise RuntimeError(f"lookup of {SEARCHES[i % len(SEARCHES)]} failed")
+
+    bench.measure("cold_lookup", lookup, setup=fresh_service)
+    for i in range(len(SEARCHES)):
+        lookup(i)
+    bench.measure("warm_lookup", lookup)
+
+    # The Draw tab's work for one structure: parse, describe and depict it
+    molblock = Chem.MolToMolBlock(Chem.MolFromSmiles(KETCHER_SMILES))
+
+    def ketcher_analysis(i):
+        mol = Chem.MolFromMolBlock(molblock)
+        Chem.MolToSmiles(mol)
+        descriptor_engine.calculate(mol)
+        depiction.render_molecule(mol)
+
+    bench.measure("ketcher_analysis", ketcher_analysis, setup=lambda: reset_caches(workdir))
+    return bench.results
+
+
+# Scenarios slower than the baseline p95 by more than the tolerance (and
+# MIN_SLACK_MS), or sending more upstream requests, count as regressions
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, expected in baseline['scenarios'].items():
+        actual = results.get(name)
+        if actual is None:
+            continue
+        if actual['p95_ms'] > max(expected['p95_ms'] * (1 + tolerance), expected['p95_ms'] + MIN_SLACK_MS):
+            regressions.append(f"{name}: p95 {actual['p95_ms']} ms vs baseline {expected['p95_ms']} ms")
+        if actual['requests'] > expected['requests']:
+            regressions.append(f"{name}: {actual['requests']} requests vs baseline {expected['requests']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks against a PubChem stub")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed p95 slowdown as a fraction")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline with this run")
+    args = parser.parse_args()
+
+    stub = StubServer().start()
+    workdir = tempfile.mkdtemp(prefix="chemvis-bench-")
+    isolate_environment(workdir, stub)
+    tracemalloc.start()
+    try:
+        results = run_scenarios(args.iterations, workdir, stub)
+    finally:
+        tracemalloc.stop()
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'python': platform.python_version(),
+        'iterations': args.iterations,
+        'scenarios': results,
+        'unrecorded_requests': sorted(set(stub.misses)),
+    }
+    if stub.misses:
+        print(f"warning: {len(set(stub.misses))} requests had no recording, see unrecorded_requests")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+UPSTREAM_URL = "https://pubchem.ncbi.nlm.nih.gov"
+
+NOT_FOUND_BODY = json.dumps({
+    "Fault": {"Code": "PUGREST.NotFound", "Message": "No CID found"}
+}).encode("utf-8")
+
+
+def recording_key(method, path, body=b""):
+    raw = method.encode("utf-8") + b" " + path.encode("utf-8") + b"\n" + (body or b"")
+    return hashlib.sha1(raw).hexdigest()
+
+
+# PUG REST responses stored one JSON file per request under recordings/
+class RecordingStore:
+    def __init__(self, directory=RECORDINGS_DIR):
+        self.directory = directory
+
+    def _path(self, method, path, body):
+        return os.path.join(self.directory, f"{recording_key(method, path, body)}.json")
+
+    def get(self, method, path, body=b""):
+        file_path = self._path(method, path, body)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path) as f:
+            recording = json.load(f)
+        return recording['status'], recording['content_type'], base64.b64decode(recording['content'])
+
+    def put(self, method, path, body, status, content_type, content):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(method, path, body), "w") as f:
+            json.dump({
+                'method': method,
+                'path': path,
+                'body': (body or b"").decode("utf-8"),
+                'status': status,
+                'content_type': content_type,
+                'content': base64.b64encode(content).decode("ascii"),
+            }, f, indent=1)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _serve(self, method):
+        body = b""
+        if method == "POST":
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+
+        response = server.store.get(method, self.path, body)
+        if response is None and server.record:
+            upstream = requests.request(method, UPSTREAM_URL + self.path, data=body or None, timeout=30)
+            response = (upstream.status_code, upstream.headers.get("Content-Type", ""), upstream.content)
+            server.store.put(method, self.path, body, *response)
+        if response is None:
+            with server.lock:
+                server.misses.append(f"{method} {self.path}")
+            response = (404, "application/json", NOT_FOUND_BODY)
+
+        status, content_type, content = response
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._serve("GET")
+
+    def do_POST(self):
+        self._serve("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Local stand-in for PubChem that replays recorded responses. With record=True
+# unknown requests are forwarded to the live service and saved for next time.
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, store=None, record=False):
+        super().__init__(("127.0.0.1", port), _StubHandler)
+        self.store = store or RecordingStore()
+        self.record = record
+        self.request_count = 0
+        self.misses = []
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}/rest/pug"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="pubchem-stub", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded PubChem PUG REST responses")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--record", action="store_true", help="forward unknown requests to PubChem and save them")
+    args = parser.parse_args()
+
+    server = StubServer(args.port, record=args.record)
+    print(f"Serving PubChem stub at {server.base_url} (set PUBCHEM_BASE_URL to this)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
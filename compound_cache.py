@@ -0,0 +1,226 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "compounds.sqlite3")
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+# How long past its TTL a record is still kept, to be served while PubChem is
+# slow or down and refreshed in the background
+DEFAULT_STALE_TTL = 30 * 24 * 3600
+
+# Only rewrite accessed_at when it is older than this, so hits stay read-mostly
+TOUCH_INTERVAL = 60
+
+
+# Normalize a search query so "Aspirin " and "aspirin" share one cache entry
+def normalize_query(name):
+    return " ".join(str(name).split()).lower()
+
+
+# Persistent compound cache shared by every process that points at the same file.
+# Records are stored once per CID and reachable by query name, CID or InChIKey.
+# The file is in WAL mode, which needs shared memory: processes on one host
+# only, never a file on a network filesystem mounted by several hosts.
+class CompoundCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 stale_ttl=DEFAULT_STALE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("COMPOUND_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl=float(os.getenv("COMPOUND_CACHE_TTL", DEFAULT_TTL)),
+            max_entries=int(os.getenv("COMPOUND_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            stale_ttl=float(os.getenv("COMPOUND_CACHE_STALE_TTL", DEFAULT_STALE_TTL)),
+        )
+
+    # One connection per thread; sqlite connections must not cross threads
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS compounds (
+                cid INTEGER PRIMARY KEY,
+                inchikey TEXT,
+                payload TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS compounds_inchikey ON compounds (inchikey);
+            CREATE INDEX IF NOT EXISTS compounds_accessed_at ON compounds (accessed_at);
+            CREATE TABLE IF NOT EXISTS compound_aliases (
+                query TEXT PRIMARY KEY,
+                cid INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS compound_aliases_cid ON compound_aliases (cid);
+        """)
+
+    # Records past their TTL are only returned with allow_stale, marked 'stale'
+    def _lookup(self, where, params, allow_stale=False):
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                f"SELECT cid, payload, stored_at, accessed_at FROM compounds WHERE {where}",
+                params,
+            ).fetchone()
+            if not row:
+                return None
+
+            cid, payload, stored_at, accessed_at = row
+            now = time.time()
+            stale = now - stored_at > self.ttl
+            if stale and (not allow_stale or now - stored_at > self.ttl + self.stale_ttl):
+                return None
+            if now - accessed_at > TOUCH_INTERVAL:
+                conn.execute("UPDATE compounds SET accessed_at = ? WHERE cid = ?", (now, cid))
+            data = json.loads(payload)
+            if stale:
+                data['stale'] = True
+            return data
+        except sqlite3.Error:
+            return None
+
+    # Look up a compound by the name the user typed
+    def get(self, query, allow_stale=False):
+        return self._lookup(
+            "cid = (SELECT cid FROM compound_aliases WHERE query = ?)",
+            (normalize_query(query),),
+            allow_stale,
+        )
+
+    def get_by_cid(self, cid, allow_stale=False):
+        return self._lookup("cid = ?", (int(cid),), allow_stale)
+
+    def get_by_inchikey(self, inchikey):
+        return self._lookup("inchikey = ?", (inchikey,))
+
+    # Point another query at a stored record without touching its freshness
+    def add_alias(self, query, cid):
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO compound_aliases (query, cid) VALUES (?, ?)",
+                (normalize_query(query), int(cid)),
+            )
+        except sqlite3.Error:
+            pass
+
+    # Store a molecule record and remember the query that resolved to it
+    def put(self, query, data):
+        if not data or data.get('cid') is None:
+            return
+        inchikey = data.get('inchikey')
+        if inchikey == 'N/A':
+            inchikey = None
+
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("""
+                    INSERT INTO compounds (cid, inchikey, payload, stored_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (cid) DO UPDATE SET
+                        inchikey = excluded.inchikey,
+                        payload = excluded.payload,
+                        stored_at = excluded.stored_at,
+                        accessed_at = excluded.accessed_at
+                """, (int(data['cid']), inchikey, json.dumps(data), now, now))
+                if query:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO compound_aliases (query, cid) VALUES (?, ?)",
+                        (normalize_query(query), int(data['cid'])),
+                    )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            pass
+
+    # Every stored record in CID order, a chunk at a time. Pages by CID
+    # rather than holding one long read open, so writers are never blocked.
+    def iter_records(self, chunk_size=5000):
+        conn = self._connect()
+        last_cid = -1
+        while True:
+            rows = conn.execute(
+                "SELECT cid, payload FROM compounds WHERE cid > ? ORDER BY cid LIMIT ?",
+                (last_cid, chunk_size),
+            ).fetchall()
+            if not rows:
+                return
+            last_cid = rows[-1][0]
+            yield [json.loads(payload) for _, payload in rows]
+
+    # Drop records past their stale window first, then least recently used ones beyond max_entries
+    def _evict(self, conn, now):
+        deleted = conn.execute(
+            "DELETE FROM compounds WHERE stored_at < ?", (now - self.ttl - self.stale_ttl,)
+        ).rowcount
+        (count,) = conn.execute("SELECT COUNT(*) FROM compounds").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            deleted += conn.execute("""
+                DELETE FROM compounds WHERE cid IN (
+                    SELECT cid FROM compounds ORDER BY accessed_at ASC LIMIT ?
+                )
+            """, (overflow,)).rowcount
+        if deleted:
+            conn.execute("DELETE FROM compound_aliases WHERE cid NOT IN (SELECT cid FROM compounds)")
+
+
+# Refreshes stale records off the request path, one job per query at a
+# time, so a search can be answered from the stale copy straight away.
+# fetch(query, cid) returns a fresh record or None.
+class Revalidator:
+    def __init__(self, cache, fetch, max_workers=2):
+        self.cache = cache
+        self.fetch = fetch
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="revalidate")
+
+    def submit(self, query, cid=None):
+        key = normalize_query(query)
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        self._executor.submit(self._refresh, query, key, cid)
+        return True
+
+    def _refresh(self, query, key, cid):
+        try:
+            data = self.fetch(query, cid)
+            if data and not data.get('fetch_errors'):
+                self.cache.put(query, data)
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(key)
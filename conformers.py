@@ -0,0 +1,168 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+CONFORMER_CACHE_DIR = os.getenv("CONFORMER_CACHE_DIR", os.path.join(".cache", "conformers"))
+
+# Seconds a molecule may spend embedding and optimizing, counted from when a
+# worker picks it up; time spent queued behind other molecules is free
+TIME_BUDGET = float(os.getenv("CONFORMER_TIME_BUDGET", 20))
+
+# Extra time a running job gets before we stop waiting for it, since the
+# worker only checks its budget between embedding steps
+BUDGET_GRACE = 10
+
+# A molecule that failed or ran out of time is retried after this many seconds
+RETRY_AFTER = float(os.getenv("CONFORMER_RETRY_AFTER", 300))
+MAX_WORKERS = int(os.getenv("CONFORMER_WORKERS", 2))
+
+NUM_CONFORMERS = 4
+RANDOM_SEED = 0xf00d
+
+_pool = None
+_jobs = {}
+# Canonical SMILES -> monotonic time of its last failure
+_failed = {}
+_lock = threading.Lock()
+
+
+def canonical_smiles(smiles):
+    mol = Chem.MolFromSmiles(smiles) if smiles and smiles != 'N/A' else None
+    return Chem.MolToSmiles(mol) if mol else None
+
+
+def _cache_path(smiles):
+    key = hashlib.sha1(smiles.encode("utf-8")).hexdigest()
+    return os.path.join(CONFORMER_CACHE_DIR, key[:2], f"{key}.mol")
+
+
+# Worker entry point: ETKDG embedding of a few conformers using every core,
+# then MMFF (or UFF) optimization, returning the lowest-energy one as a Mol
+# block. Later steps are skipped once the budget is spent, so a hard molecule
+# gives its worker back instead of holding it indefinitely.
+def embed_conformer(smiles, budget=TIME_BUDGET):
+    give_up_at = time.monotonic() + budget
+    mol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+
+    params = AllChem.ETKDGv3()
+    params.randomSeed = RANDOM_SEED
+    params.numThreads = 0
+    conf_ids = list(AllChem.EmbedMultipleConfs(mol, NUM_CONFORMERS, params))
+    if not conf_ids and time.monotonic() < give_up_at:
+        # Strained or large ring systems often need random starting coordinates
+        params.useRandomCoords = True
+        conf_ids = list(AllChem.EmbedMultipleConfs(mol, NUM_CONFORMERS, params))
+    if not conf_ids:
+        return None
+
+    if time.monotonic() >= give_up_at:
+        # Out of time: an unoptimized conformer is still better than none
+        return Chem.MolToMolBlock(mol, confId=conf_ids[0])
+
+    if AllChem.MMFFHasAllMoleculeParams(mol):
+        results = AllChem.MMFFOptimizeMoleculeConfs(mol, numThreads=0, maxIters=500)
+    elif AllChem.UFFHasAllMoleculeParams(mol):
+        results = AllChem.UFFOptimizeMoleculeConfs(mol, numThreads=0, maxIters=500)
+    else:
+        results = [(0, 0.0)] * len(conf_ids)
+
+    best = min(range(len(conf_ids)), key=lambda i: results[i][1])
+    return Chem.MolToMolBlock(mol, confId=conf_ids[best])
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Spawned workers keep embedding off the Streamlit script and server threads
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=get_context("spawn"))
+    return _pool
+
+
+def _store(smiles, future):
+    try:
+        molblock = future.result()
+    except Exception:
+        molblock = None
+
+    with _lock:
+        # The job may already have been given up on and replaced
+        job = _jobs.get(smiles)
+        if job is not None and job[0] is future:
+            del _jobs[smiles]
+        if not molblock:
+            _failed[smiles] = time.monotonic()
+            return
+        _failed.pop(smiles, None)
+
+    path = _cache_path(smiles)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(molblock)
+    os.replace(tmp_path, path)
+
+
+# Whether a SMILES failed recently enough not to be retried yet. Call with _lock held.
+def _recently_failed(smiles):
+    failed_at = _failed.get(smiles)
+    if failed_at is None:
+        return False
+    if time.monotonic() - failed_at > RETRY_AFTER:
+        del _failed[smiles]
+        return False
+    return True
+
+
+# Return a cached conformer Mol block for a SMILES, or start generating one
+# in the background and return None. Poll conformer_status while it runs.
+def request_conformer(smiles):
+    smiles = canonical_smiles(smiles)
+    if not smiles:
+        return None
+
+    path = _cache_path(smiles)
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read()
+
+    with _lock:
+        if smiles in _jobs or _recently_failed(smiles):
+            return None
+        future = _get_pool().submit(embed_conformer, smiles, TIME_BUDGET)
+        # Start time is filled in once a worker is seen running the job
+        _jobs[smiles] = [future, None]
+    future.add_done_callback(lambda done: _store(smiles, done))
+    return None
+
+
+# 'ready', 'pending', 'failed' or 'missing' for a SMILES
+def conformer_status(smiles):
+    smiles = canonical_smiles(smiles)
+    if not smiles:
+        return 'failed'
+    if os.path.exists(_cache_path(smiles)):
+        return 'ready'
+
+    with _lock:
+        if _recently_failed(smiles):
+            return 'failed'
+        job = _jobs.get(smiles)
+        if job is None:
+            return 'missing'
+        future, started = job
+        if started is None:
+            if future.running():
+                job[1] = time.monotonic()
+        elif time.monotonic() - started > TIME_BUDGET + BUDGET_GRACE:
+            # The worker stops on its own budget; this only covers a single
+            # embedding step that overruns it
+            _jobs.pop(smiles, None)
+            _failed[smiles] = time.monotonic()
+            return 'failed'
+    return 'pending'
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import startup
+from compound_cache import CompoundCache, Revalidator, normalize_query
+from payload_store import PayloadStore
+from shared_cache import open_store
+from singleflight import SingleFlight
+
+# Lookups in flight at once in the JSONL CLI
+CONCURRENCY = int(os.getenv("CORE_CONCURRENCY", 8))
+
+# Seconds an image PubChem confirmed it does not have (e.g. no 3D picture)
+# is remembered as missing, in every tier
+MISSING_IMAGE_TTL = 300
+
+# Seconds a record with fetch_errors (a PubChem call failed part way) is
+# reused before it is fetched again
+PARTIAL_RECORD_TTL = 60
+
+
+# RDKit molecule for a SMILES string, or None when it is missing or invalid
+def parse_smiles(smiles):
+    if not smiles or smiles == 'N/A':
+        return None
+    try:
+        with startup.phase("import rdkit"):
+            from rdkit import Chem
+        return Chem.MolFromSmiles(smiles)
+    except Exception:
+        return None
+
+
+# Descriptor values of one compound; {} when its SMILES does not parse
+def calculate_descriptors(smiles, names='basic'):
+    mol = parse_smiles(smiles)
+    if mol is None:
+        return {}
+    with startup.phase("import descriptor_engine"):
+        import descriptor_engine
+    return descriptor_engine.calculate(mol, names)
+
+
+# Selected descriptors plus drug-likeness rule checks and fingerprints
+def property_profile(smiles, names='basic'):
+    mol = parse_smiles(smiles)
+    if mol is None:
+        return None
+    with startup.phase("import descriptor_engine"):
+        import descriptor_engine
+    return {
+        'descriptors': descriptor_engine.calculate(mol, names),
+        'rules': descriptor_engine.rule_checks(mol),
+        'fingerprints': descriptor_engine.fingerprints(mol),
+    }
+
+
+# Canonical SMILES of a Mol block (or SMILES), or None
+def drawing_smiles(molblock):
+    try:
+        with startup.phase("import rdkit"):
+            from rdkit import Chem
+        mol = Chem.MolFromMolBlock(molblock) or Chem.MolFromSmiles(molblock)
+        return Chem.MolToSmiles(mol) if mol else None
+    except Exception:
+        return None
+
+
+# Render one molecule image locally, falling back to PubChem's PNG. A
+# smaller size gives a thumbnail. Returns None when PubChem has no such
+# image, and raises when fetching it failed.
+def render_image(cid, kind, smiles, sdf, size=None):
+    options = {'size': size} if size else {}
+    try:
+        with startup.phase("import depiction"):
+            import depiction
+        png = depiction.render_smiles(smiles, **options) if kind == '2d' else depiction.render_sdf(sdf, **options)
+        if png:
+            return png
+    except Exception:
+        pass
+
+    with startup.phase("import pubchem"):
+        import pubchem
+    png = pubchem.fetch_image(cid, kind)
+    if png and size:
+        import depiction
+        png = depiction.thumbnail(png, size)
+    return png
+
+
+# The lookup pipeline without any UI: persistent compound cache, synonym
+# index and PubChem behind a payload store (in-process, or tiered over a
+# cache shared by every replica, see shared_cache.open_store), with
+# concurrent identical requests coalesced. The Streamlit app, the JSONL CLI
+# below and server.py all go through one of these. Errors are raised, not
+# displayed; callers decide how to report them.
+class MoleculeService:
+    def __init__(self, cache=None, synonyms=None, store=None, flights=None):
+        self.cache = cache
+        self.synonyms = synonyms
+        # An empty store is falsy (it has a length), so test for None
+        self.store = store if store is not None else PayloadStore()
+        self.flights = flights if flights is not None else SingleFlight()
+        self.revalidator = Revalidator(cache, self._fetch_fresh) if cache else None
+
+    @classmethod
+    def from_env(cls):
+        try:
+            cache = CompoundCache.from_env()
+        except Exception:
+            cache = None
+        try:
+            with startup.phase("import synonym_index"):
+                from synonym_index import SynonymIndex
+            synonyms = SynonymIndex.load()
+        except Exception:
+            synonyms = None
+        pool = None
+        if os.getenv("SHARED_CACHE", "").lower() == 'postgres' and os.getenv("DB_URL"):
+            with startup.phase("import db"):
+                from db import ConnectionPool
+            pool = ConnectionPool.from_env()
+        return cls(cache, synonyms, open_store(pool))
+
+    @staticmethod
+    def _fetch_fresh(name, cid):
+        with startup.phase("import pubchem"):
+            import pubchem
+        return pubchem.fetch_molecule_data(name, cid=cid)
+
+    # Stale records are served as they are while a fresh copy is fetched
+    def _revalidate_if_stale(self, name, data):
+        if data.get('stale') and self.revalidator:
+            self.revalidator.submit(name, data['cid'])
+        return data
+
+    # Resolve a name or CID through the persistent cache, the synonym index and PubChem
+    def fetch(self, name):
+        cache = self.cache
+        if cache:
+            cached = cache.get(name, allow_stale=True)
+            if cached:
+                return self._revalidate_if_stale(name, cached)
+
+        # A bare number is a CID (as in batch_lookup.classify_identifier) and a
+        # synonym the index knows resolves to its CID without PubChem; either
+        # may already be cached under another name for the same compound
+        query = str(name).strip()
+        if query.isdigit():
+            cid = int(query)
+        else:
+            cid = self.synonyms.lookup(name) if self.synonyms else None
+        if cache and cid:
+            cached = cache.get_by_cid(cid, allow_stale=True)
+            if cached:
+                cache.add_alias(name, cid)
+                return self._revalidate_if_stale(name, cached)
+
+        metrics.cache_miss()
+        mol_data = self._fetch_fresh(name, cid)
+
+        # Partial results are returned but not persisted, so they are retried later
+        if mol_data and cache and not mol_data.get('fetch_errors'):
+            cache.put(name, mol_data)
+
+        return mol_data
+
+    # Molecule record for a name, or None when PubChem has no such compound.
+    # Records, SDF included, are kept in the payload store;
+    # unknown names are remembered too.
+    def lookup(self, name):
+        key = f"compound:{normalize_query(name)}"
+        payload = self.store.get(key)
+        if payload is not None:
+            return json.loads(payload)
+
+        mol_data = self.flights.do(key, lambda: self.fetch(name))
+
+        # Stale records are re-read from the persistent cache until refreshed,
+        # and partial ones only coalesce a burst of searches, not a whole day
+        if mol_data and mol_data.get('fetch_errors'):
+            self.store.put(key, json.dumps(mol_data), ttl=PARTIAL_RECORD_TTL)
+        elif not (mol_data and mol_data.get('stale')):
+            self.store.put(key, json.dumps(mol_data))
+        return mol_data
+
+    # Encoded PNG of a compound, or None
+    def image(self, cid, kind='2d', smiles=None, sdf=None, size=None):
+        key = f"image:{cid}:{kind}:{size or 'full'}"
+        png = self.store.get(key)
+        if png is None:
+            metrics.cache_miss()
+            try:
+                png = self.flights.do(key, lambda: render_image(cid, kind, smiles, sdf, size))
+            except Exception:
+                # A PubChem error or timeout is not cached; the next request retries
+                return None
+            if png:
+                self.store.put(key, png)
+            else:
+                # Confirmed missing: remembered briefly, not for the store's full TTL
+                self.store.put(key, b"", ttl=MISSING_IMAGE_TTL)
+        return png or None
+
+    # Descriptor values for a SMILES string, kept in the payload store
+    def describe(self, smiles, names='basic'):
+        label = names if isinstance(names, str) else ",".join(names)
+        with startup.phase("import descriptor_engine"):
+            import descriptor_engine
+        names = descriptor_engine.resolve_descriptor_names(names)
+        key = f"descriptors:{label}:{smiles}"
+        payload = self.store.get(key)
+        if payload is not None:
+            return json.loads(payload)
+        values = calculate_descriptors(smiles, names)
+        self.store.put(key, json.dumps(values))
+        return values
+
+    # One JSON-ready result for a query: the record (without its SDF unless
+    # asked for) and optionally descriptors. Failures become an 'error' field.
+    def resolve(self, query, descriptors=None, include_sdf=False):
+        result = {'query': query}
+        try:
+            data = self.lookup(query)
+            if not data:
+                result['error'] = "not found"
+                return result
+            record = dict(data)
+            if not include_sdf:
+                record.pop('sdf', None)
+            result['record'] = record
+            if descriptors:
+                result['descriptors'] = self.describe(data['smiles'], descriptors)
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+
+
+# Queries from a text file (one per line) or JSONL ({"query": ...} per line)
+def read_queries(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                line = str(json.loads(line).get('query', "")).strip()
+            except ValueError:
+                pass
+        if line:
+            yield line
+
+
+# Resolve queries with bounded concurrency, yielding results in input order.
+# At most concurrency * 2 queries are held at once, so input of any size
+# streams through.
+def resolve_all(service, queries, concurrency=CONCURRENCY, descriptors=None, include_sdf=False):
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="core") as executor:
+        pending = []
+        for query in queries:
+            pending.append(executor.submit(service.resolve, query, descriptors, include_sdf))
+            if len(pending) >= concurrency * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve compounds to JSONL without the UI")
+    parser.add_argument("input", help="file of names, CIDs or {\"query\": ...} lines; - for stdin")
+    parser.add_argument("--output", help="JSONL file to write; stdout by default")
+    parser.add_argument("--descriptors", help="descriptor set (basic, drug-likeness, all) or comma-separated names")
+    parser.add_argument("--include-sdf", action="store_true", help="keep the 3D SDF in each record")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    descriptors = None
+    if args.descriptors:
+        with startup.phase("import descriptor_engine"):
+            import descriptor_engine
+        descriptors = descriptor_engine.parse_descriptor_option(args.descriptors)
+
+    service = MoleculeService.from_env()
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    count = failed = 0
+    try:
+        for result in resolve_all(service, read_queries(source), args.concurrency, descriptors, args.include_sdf):
+            output.write(json.dumps(result) + "\n")
+            count += 1
+            failed += 'error' in result
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"Resolved {count - failed} of {count} queries in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
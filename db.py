@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Thread-safe Postgres pool shared by every session. Connections are created
+# on demand, checked for liveness before reuse and replaced when they break,
+# so a database restart heals itself instead of poisoning a cached connection.
+class ConnectionPool:
+    def __init__(self, dsn, minconn=0, maxconn=10, checkout_timeout=5, health_check_interval=30):
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        # minconn defaults to 0 so creating the pool never fails while the DB is down
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("DB_URL"),
+            minconn=int(os.getenv("DB_POOL_MIN", 0)),
+            maxconn=int(os.getenv("DB_POOL_MAX", 10)),
+            checkout_timeout=float(os.getenv("DB_POOL_TIMEOUT", 5)),
+        )
+
+    # Idle connections get a cheap round trip before being handed out
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def _checkout(self):
+        # One retry: a dead connection is dropped and the pool dials a fresh one
+        for _ in range(2):
+            conn = self._pool.getconn()
+            if self._is_alive(conn):
+                return conn
+            self._discard(conn)
+        raise psycopg2.OperationalError("could not obtain a live database connection")
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolTimeout(f"no database connection free after {self.checkout_timeout}s")
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._discard(conn)
+                raise
+            except BaseException:
+                # Includes GeneratorExit, so a streaming reader closed early
+                # still hands its connection back
+                try:
+                    conn.rollback()
+                    self._pool.putconn(conn)
+                except psycopg2.Error:
+                    self._discard(conn)
+                raise
+            else:
+                # Never return a connection with an open transaction to the pool
+                try:
+                    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    self._last_used[id(conn)] = time.monotonic()
+                    self._pool.putconn(conn)
+                except psycopg2.Error:
+                    self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._pool.closeall()
+
+
+HISTORY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS molecule_history (
+        id SERIAL PRIMARY KEY,
+        compound_name VARCHAR(255),
+        cid INTEGER,
+        formula VARCHAR(100),
+        molecular_weight FLOAT,
+        smiles TEXT,
+        inchi TEXT,
+        logp FLOAT,
+        tpsa FLOAT,
+        searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# One row per (normalized query, CID) with a hit counter, replacing the
+# original append-only log. Existing duplicates are folded into their
+# newest row before the unique index is built.
+HISTORY_MIGRATION_SQL = """
+    ALTER TABLE molecule_history ADD COLUMN IF NOT EXISTS query_key TEXT;
+    ALTER TABLE molecule_history ADD COLUMN IF NOT EXISTS hit_count INTEGER NOT NULL DEFAULT 1;
+
+    UPDATE molecule_history
+    SET query_key = lower(regexp_replace(btrim(compound_name), '\\s+', ' ', 'g'))
+    WHERE query_key IS NULL;
+
+    CREATE TEMPORARY TABLE history_ranked ON COMMIT DROP AS
+    SELECT id,
+           row_number() OVER (PARTITION BY query_key, cid ORDER BY searched_at DESC, id DESC) AS rank,
+           sum(hit_count) OVER (PARTITION BY query_key, cid) AS total
+    FROM molecule_history;
+
+    UPDATE molecule_history m SET hit_count = r.total
+    FROM history_ranked r WHERE m.id = r.id AND r.rank = 1;
+
+    DELETE FROM molecule_history m
+    USING history_ranked r WHERE m.id = r.id AND r.rank > 1;
+
+    CREATE UNIQUE INDEX molecule_history_query_cid_key ON molecule_history (query_key, cid);
+    CREATE INDEX IF NOT EXISTS molecule_history_searched_at_idx ON molecule_history (searched_at DESC);
+    CREATE INDEX IF NOT EXISTS molecule_history_hit_count_idx ON molecule_history (hit_count DESC);
+"""
+
+# Arbitrary key so concurrently starting replicas migrate one at a time
+MIGRATION_LOCK_ID = 7205412
+
+
+# Run schema DDL holding the migration lock, so replicas starting at the same
+# time do not race each other creating the same tables and indexes
+def ensure_schema(pool, sql):
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute(sql)
+        conn.commit()
+
+
+# Create the history table and bring older layouts up to date
+def ensure_history_schema(pool):
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute(HISTORY_TABLE_SQL)
+        cur.execute("SELECT to_regclass('molecule_history_query_cid_key')")
+        if cur.fetchone()[0] is None:
+            cur.execute(HISTORY_MIGRATION_SQL)
+        conn.commit()
+
+
+# Most recent searches; served by the searched_at index, so cost is O(limit)
+def recent_history(pool, limit=10):
+    with pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT query_key, compound_name, cid, formula, molecular_weight, hit_count, searched_at
+            FROM molecule_history
+            ORDER BY searched_at DESC
+            LIMIT %s
+        """, (limit,))
+        return [dict(row) for row in cur.fetchall()]
+
+
+# Most searched (query, compound) pairs, served by the hit_count index
+def popular_compounds(pool, limit=5):
+    with pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT query_key, compound_name, cid, formula, hit_count, searched_at
+            FROM molecule_history
+            ORDER BY hit_count DESC
+            LIMIT %s
+        """, (limit,))
+        return [dict(row) for row in cur.fetchall()]
+
+
+# Every history row in id order, a chunk at a time. A named cursor keeps the
+# result set on the server, so client memory is bounded by chunk_size however
+# large the table is. Holds one pooled connection until exhausted or closed.
+def iter_history(pool, chunk_size=5000):
+    with pool.connection() as conn, \
+            conn.cursor(name="history_export", cursor_factory=RealDictCursor) as cur:
+        cur.itersize = chunk_size
+        cur.execute("""
+            SELECT id, query_key, compound_name, cid, formula, molecular_weight,
+                   smiles, inchi, logp, tpsa, hit_count, searched_at
+            FROM molecule_history
+            ORDER BY id
+        """)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+
+
+# (id, smiles, compound_name, cid) of history rows after after_id, in id
+# order, a chunk at a time through a server-side cursor. Used to backfill the
+# similarity index with what it has not seen yet.
+def iter_history_compounds(pool, after_id=0, chunk_size=5000):
+    with pool.connection() as conn, conn.cursor(name="history_compounds") as cur:
+        cur.itersize = chunk_size
+        cur.execute("""
+            SELECT id, smiles, compound_name, cid
+            FROM molecule_history
+            WHERE id > %s AND smiles IS NOT NULL
+            ORDER BY id
+        """, (after_id,))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
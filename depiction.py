@@ -0,0 +1,153 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+from rdkit import Chem
+from rdkit.Chem import rdDepictor
+from rdkit.Chem.Draw import rdMolDraw2D
+
+DEPICTION_CACHE_DIR = os.getenv("DEPICTION_CACHE_DIR", os.path.join(".cache", "depictions"))
+
+DEFAULT_SIZE = 500
+
+# The depiction cache is pruned back under this size, least recently used first
+DEPICTION_CACHE_MAX_MB = float(os.getenv("DEPICTION_CACHE_MAX_MB", 256))
+
+# The cache directory is scanned for pruning once every this many writes
+PRUNE_EVERY = 200
+
+# Only refresh a cached file's mtime when it is older than this, so hits stay read-mostly
+TOUCH_INTERVAL = 60
+
+_writes = 0
+_writes_lock = threading.Lock()
+_prune_lock = threading.Lock()
+
+
+def _cache_key(mol, fmt, size, theme, use_coords):
+    identity = Chem.MolToSmiles(mol)
+    # Depictions that keep the molecule's own coordinates depend on them too
+    if use_coords:
+        identity += "\n" + Chem.MolToMolBlock(mol)
+    raw = f"{identity}|{fmt}|{size}|{theme}|{use_coords}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _draw(mol, fmt, size, theme, use_coords):
+    mol = Chem.Mol(mol)
+    if not use_coords or mol.GetNumConformers() == 0:
+        rdDepictor.Compute2DCoords(mol)
+
+    if fmt == 'svg':
+        drawer = rdMolDraw2D.MolDraw2DSVG(size, size)
+    else:
+        drawer = rdMolDraw2D.MolDraw2DCairo(size, size)
+
+    options = drawer.drawOptions()
+    if theme == 'dark':
+        rdMolDraw2D.SetDarkMode(options)
+    options.clearBackground = True
+
+    rdMolDraw2D.PrepareAndDrawMolecule(drawer, mol)
+    drawer.FinishDrawing()
+    return drawer.GetDrawingText()
+
+
+# Render a Mol to PNG bytes or SVG text with RDKit, cached on disk by
+# canonical SMILES and rendering options. Set use_coords to keep the
+# molecule's own (e.g. 3D conformer) coordinates instead of a fresh layout.
+def render_molecule(mol, fmt='png', size=DEFAULT_SIZE, theme='dark', use_coords=False):
+    key = _cache_key(mol, fmt, size, theme, use_coords)
+    path = os.path.join(DEPICTION_CACHE_DIR, key[:2], f"{key}.{fmt}")
+    mode = "b" if fmt == 'png' else ""
+
+    if os.path.exists(path):
+        with open(path, "r" + mode) as f:
+            data = f.read()
+        # mtime doubles as the last access time for pruning
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+                os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    data = _draw(mol, fmt, size, theme, use_coords)
+
+    # Write to a temporary file first so concurrent readers never see half an image
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w" + mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _count_write()
+    return data
+
+
+def _count_write():
+    global _writes
+    with _writes_lock:
+        _writes += 1
+        due = _writes % PRUNE_EVERY == 0
+    if due:
+        prune()
+
+
+# Delete the least recently used depictions until the cache fits in max_mb.
+# Files another process removes first are skipped.
+def prune(max_mb=DEPICTION_CACHE_MAX_MB):
+    if not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        files = []
+        total = 0
+        for directory, _, names in os.walk(DEPICTION_CACHE_DIR):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        budget = max_mb * 1024 * 1024
+        for _, size, path in sorted(files):
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+    finally:
+        _prune_lock.release()
+
+
+def render_smiles(smiles, **options):
+    mol = Chem.MolFromSmiles(smiles) if smiles and smiles != 'N/A' else None
+    return render_molecule(mol, **options) if mol else None
+
+
+# Project a 3D SDF record onto the page, as a local stand-in for PubChem's 3D picture
+def render_sdf(sdf, **options):
+    mol = Chem.MolFromMolBlock(sdf) if sdf else None
+    return render_molecule(mol, use_coords=True, **options) if mol else None
+
+
+# Downscale an encoded PNG, e.g. one fetched from PubChem, to fit in size x size.
+# Images already that small are returned unchanged.
+def thumbnail(png, size):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(png))
+    if max(image.size) <= size:
+        return png
+    image.thumbnail((size, size))
+    buf = io.BytesIO()
+    image.save(buf, format='PNG', optimize=True)
+    return buf.getvalue()
@@ -0,0 +1,249 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, RDLogger
+from rdkit.Chem import MACCSkeys, QED, Descriptors, rdFingerprintGenerator, rdMolDescriptors
+
+# The eight descriptors shown in the app, with the rounding used for display
+BASIC_DESCRIPTORS = {
+    'LogP': ('MolLogP', 2),
+    'TPSA': ('TPSA', 2),
+    'Mol Weight': ('MolWt', 2),
+    'Num H Donors': ('NumHDonors', None),
+    'Num H Acceptors': ('NumHAcceptors', None),
+    'Num Rotatable Bonds': ('NumRotatableBonds', None),
+    'Num Aromatic Rings': ('NumAromaticRings', None),
+    'Num Aliphatic Rings': ('NumAliphaticRings', None),
+}
+
+# Rule of five and Veber limits: (label, descriptor, maximum)
+LIPINSKI_RULES = [
+    ('Mol Weight', 'MolWt', 500),
+    ('LogP', 'MolLogP', 5),
+    ('H Donors', 'NumHDonors', 5),
+    ('H Acceptors', 'NumHAcceptors', 10),
+]
+VEBER_RULES = [
+    ('Rotatable Bonds', 'NumRotatableBonds', 10),
+    ('TPSA', 'TPSA', 140),
+]
+
+# Descriptors that rdMolDescriptors.Properties computes natively, by their
+# Descriptors name. Requested together they cost one C++ call per molecule
+# instead of one Python call each; the values are identical.
+NATIVE_PROPERTIES = {
+    'ExactMolWt': 'exactmw', 'MolWt': 'amw', 'MolLogP': 'CrippenClogP', 'MolMR': 'CrippenMR',
+    'TPSA': 'tpsa', 'LabuteASA': 'labuteASA', 'NumHDonors': 'NumHBD', 'NumHAcceptors': 'NumHBA',
+    'NumRotatableBonds': 'NumRotatableBonds', 'HeavyAtomCount': 'NumHeavyAtoms',
+    'NumHeteroatoms': 'NumHeteroatoms', 'NumAmideBonds': 'NumAmideBonds', 'FractionCSP3': 'FractionCSP3',
+    'RingCount': 'NumRings', 'NumAromaticRings': 'NumAromaticRings', 'NumAliphaticRings': 'NumAliphaticRings',
+    'NumSaturatedRings': 'NumSaturatedRings', 'NumHeterocycles': 'NumHeterocycles',
+    'NumAromaticHeterocycles': 'NumAromaticHeterocycles', 'NumSaturatedHeterocycles': 'NumSaturatedHeterocycles',
+    'NumAliphaticHeterocycles': 'NumAliphaticHeterocycles', 'NumSpiroAtoms': 'NumSpiroAtoms',
+    'NumBridgeheadAtoms': 'NumBridgeheadAtoms', 'NumAtomStereoCenters': 'NumAtomStereoCenters',
+    'NumUnspecifiedAtomStereoCenters': 'NumUnspecifiedAtomStereoCenters',
+    'Chi0v': 'chi0v', 'Chi1v': 'chi1v', 'Chi2v': 'chi2v', 'Chi3v': 'chi3v', 'Chi4v': 'chi4v',
+    'Chi0n': 'chi0n', 'Chi1n': 'chi1n', 'Chi2n': 'chi2n', 'Chi3n': 'chi3n', 'Chi4n': 'chi4n',
+    'HallKierAlpha': 'hallKierAlpha', 'Kappa1': 'kappa1', 'Kappa2': 'kappa2', 'Kappa3': 'kappa3', 'Phi': 'Phi',
+}
+
+# Properties returns every value as a float; counts are turned back into ints
+_INTEGER_PROPERTIES = {
+    prop for name, prop in NATIVE_PROPERTIES.items() if name.startswith('Num') or name.endswith('Count')
+}
+
+_functions = dict(Descriptors._descList)
+
+
+def _violations(rules):
+    return lambda mol: sum(_functions[name](mol) > limit for _, name, limit in rules)
+
+
+# Drug-likeness scores that are not part of RDKit's descriptor list
+EXTRA_DESCRIPTORS = {
+    'QED': QED.qed,
+    'Lipinski Violations': _violations(LIPINSKI_RULES),
+    'Veber Violations': _violations(VEBER_RULES),
+}
+_functions.update(EXTRA_DESCRIPTORS)
+
+ALL_DESCRIPTORS = [name for name, _ in Descriptors._descList]
+
+DESCRIPTOR_SETS = {
+    'basic': list(BASIC_DESCRIPTORS),
+    'drug-likeness': ['MolWt', 'MolLogP', 'NumHDonors', 'NumHAcceptors', 'NumRotatableBonds', 'TPSA',
+                      'QED', 'Lipinski Violations', 'Veber Violations'],
+    'all': ALL_DESCRIPTORS + list(EXTRA_DESCRIPTORS),
+}
+
+DEFAULT_CHUNK_SIZE = 500
+
+FINGERPRINT_BITS = 2048
+_morgan_generator = rdFingerprintGenerator.GetMorganGenerator(radius=2, fpSize=FINGERPRINT_BITS)
+
+
+# Accept a set name ('basic', 'all') or an explicit list of descriptor names
+def resolve_descriptor_names(names='basic'):
+    if isinstance(names, str):
+        return list(DESCRIPTOR_SETS[names])
+    unknown = [name for name in names if name not in BASIC_DESCRIPTORS and name not in _functions]
+    if unknown:
+        raise ValueError(f"Unknown descriptors: {', '.join(unknown)}")
+    return list(names)
+
+
+# A --descriptors command-line value: a set name as it is, anything else as
+# comma-separated descriptor names (so a single name like TPSA is a list)
+def parse_descriptor_option(value):
+    if not value or value in DESCRIPTOR_SETS:
+        return value
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def _descriptor(name):
+    if name in BASIC_DESCRIPTORS:
+        function_name, digits = BASIC_DESCRIPTORS[name]
+        return function_name, digits
+    return name, None
+
+
+# How to compute a list of descriptors: natively supported ones in a single
+# Properties call, the rest one function call each. Plans are reused.
+@lru_cache(maxsize=64)
+def _plan(names):
+    native = []
+    python = []
+    for column, name in enumerate(names):
+        function_name, digits = _descriptor(name)
+        if function_name in NATIVE_PROPERTIES:
+            native.append((column, NATIVE_PROPERTIES[function_name], digits))
+        else:
+            python.append((column, _functions[function_name], digits))
+    calculator = rdMolDescriptors.Properties([prop for _, prop, _ in native]) if native else None
+    return calculator, native, python
+
+
+# Descriptor values for one Mol, in the order of names
+def _evaluate(mol, names):
+    calculator, native, python = _plan(tuple(names))
+    values = [None] * len(names)
+    if calculator is not None:
+        for (column, prop, digits), value in zip(native, calculator.ComputeProperties(mol)):
+            if prop in _INTEGER_PROPERTIES:
+                value = int(value)
+            values[column] = round(value, digits) if digits is not None else value
+    for column, function, digits in python:
+        value = function(mol)
+        values[column] = round(value, digits) if digits is not None else value
+    return values
+
+
+# Compute the requested descriptors for one Mol as a dict
+def calculate(mol, names='basic'):
+    names = resolve_descriptor_names(names)
+    return dict(zip(names, _evaluate(mol, names)))
+
+
+# Lipinski and Veber checks for one Mol, one row per limit
+def rule_checks(mol):
+    rules = [('Lipinski', rule) for rule in LIPINSKI_RULES] + [('Veber', rule) for rule in VEBER_RULES]
+    values = _evaluate(mol, [name for _, (_, name, _) in rules])
+    return [
+        {'rule': family, 'property': label, 'value': round(value, 2), 'limit': limit, 'pass': value <= limit}
+        for (family, (label, _, limit)), value in zip(rules, values)
+    ]
+
+
+# Morgan (ECFP4-like) and MACCS fingerprints as hex strings of their bits
+def fingerprints(mol):
+    morgan = _morgan_generator.GetFingerprint(mol)
+    maccs = MACCSkeys.GenMACCSKeys(mol)
+    return {
+        f'Morgan r=2 ({FINGERPRINT_BITS} bits)': (morgan.GetNumOnBits(), _hex_bits(morgan)),
+        'MACCS keys (167 bits)': (maccs.GetNumOnBits(), _hex_bits(maccs)),
+    }
+
+
+def _hex_bits(fingerprint):
+    bits = fingerprint.ToBitString()
+    bits += "0" * (-len(bits) % 4)
+    return "".join(f"{int(bits[i:i + 4], 2):x}" for i in range(0, len(bits), 4))
+
+
+# Mol blocks span several lines; anything else is treated as SMILES
+def parse_molecule(text):
+    if "\n" in text:
+        return Chem.MolFromMolBlock(text)
+    return Chem.MolFromSmiles(text)
+
+
+# Worker entry point: one chunk in, a value matrix and per-row errors out
+def _compute_chunk(items, names):
+    RDLogger.DisableLog('rdApp.*')
+    values = np.full((len(items), len(names)), np.nan)
+    errors = [None] * len(items)
+
+    for row, text in enumerate(items):
+        try:
+            mol = parse_molecule(text)
+            if mol is None:
+                errors[row] = "could not parse structure"
+                continue
+            values[row] = _evaluate(mol, names)
+        except Exception as e:
+            errors[row] = str(e)
+    return values, errors
+
+
+def _chunks(inputs, size):
+    iterator = iter(inputs)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Compute descriptors for many SMILES or Mol blocks across a process pool.
+# Returns a DataFrame in input order with one float column per descriptor
+# and an 'error' column that is None wherever the molecule succeeded.
+def compute_descriptor_table(inputs, names='basic', chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None):
+    names = resolve_descriptor_names(names)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    matrices = []
+    errors = []
+
+    def collect(result):
+        values, chunk_errors = result
+        matrices.append(values)
+        errors.extend(chunk_errors)
+
+    chunks = _chunks(inputs, chunk_size)
+    first = next(chunks, None)
+    if first is not None and (max_workers == 1 or len(first) < chunk_size):
+        # A single short chunk is cheaper than starting a pool
+        collect(_compute_chunk(first, names))
+        for chunk in chunks:
+            collect(_compute_chunk(chunk, names))
+    elif first is not None:
+        # Spawned workers avoid forking the threads of a running Streamlit server
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as pool:
+            # Keep a bounded number of chunks in flight so huge iterables stream through
+            pending = [pool.submit(_compute_chunk, first, names)]
+            for chunk in chunks:
+                pending.append(pool.submit(_compute_chunk, chunk, names))
+                if len(pending) >= max_workers * 2:
+                    collect(pending.pop(0).result())
+            for future in pending:
+                collect(future.result())
+
+    values = np.vstack(matrices) if matrices else np.empty((0, len(names)))
+    table = pd.DataFrame(values, columns=names)
+    table['error'] = errors
+    return table
@@ -0,0 +1,225 @@
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(".cache", "exports"))
+CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+FORMATS = ['csv', 'sdf', 'parquet']
+
+# Keys of descriptor_engine.DESCRIPTOR_SETS, so choosing one does not import RDKit
+DESCRIPTOR_SETS = ['basic', 'drug-likeness', 'all']
+
+# Columns written per source, with the type each is coerced to. PubChem's
+# 'N/A' placeholders become empty values.
+SOURCES = {
+    'history': [
+        ('id', 'int'), ('query_key', 'str'), ('compound_name', 'str'), ('cid', 'int'),
+        ('formula', 'str'), ('molecular_weight', 'float'), ('smiles', 'str'), ('inchi', 'str'),
+        ('logp', 'float'), ('tpsa', 'float'), ('hit_count', 'int'), ('searched_at', 'time'),
+    ],
+    'compounds': [
+        ('cid', 'int'), ('iupac', 'str'), ('formula', 'str'), ('weight', 'float'), ('smiles', 'str'),
+        ('inchi', 'str'), ('inchikey', 'str'), ('xlogp', 'float'), ('tpsa', 'float'),
+        ('complexity', 'float'), ('h_bond_donor', 'int'), ('h_bond_acceptor', 'int'),
+        ('rotatable_bonds', 'int'),
+    ],
+}
+
+
+def _coerce(value, kind):
+    if value is None or value == 'N/A' or value == '':
+        return None
+    try:
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            value = float(value)
+            return None if math.isnan(value) else value
+        if kind == 'str':
+            return str(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+# Chunks of raw rows for a source, read incrementally from where it lives
+def iter_source(source, chunk_size=CHUNK_SIZE, pool=None, cache=None):
+    if source == 'history':
+        import db
+
+        return db.iter_history(pool or db.ConnectionPool.from_env(), chunk_size)
+    if source == 'compounds':
+        from compound_cache import CompoundCache
+
+        return (cache or CompoundCache.from_env()).iter_records(chunk_size)
+    raise ValueError(f"unknown export source: {source}")
+
+
+class _CsvWriter:
+    def __init__(self, path, fields, descriptors):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, [name for name, _ in fields] + descriptors,
+                                      extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, fields, descriptors):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'time': pa.timestamp('us')}
+        self._pa = pa
+        self._schema = pa.schema([(name, types[kind]) for name, kind in fields] +
+                                 [(name, pa.float64()) for name in descriptors])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    # One row group per chunk
+    def write(self, rows):
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+# Multi-record SDF. Compound records carry PubChem's 3D SDF, which is
+# written as is; history rows only have SMILES and get 2D coordinates.
+class _SdfWriter:
+    def __init__(self, path, fields, descriptors):
+        from rdkit import Chem, RDLogger
+        from rdkit.Chem import rdDepictor
+
+        RDLogger.DisableLog('rdApp.*')
+        self._chem = Chem
+        self._depictor = rdDepictor
+        self._columns = [name for name, _ in fields if name != 'smiles'] + descriptors
+        self._writer = Chem.SDWriter(path)
+        self.skipped = 0
+
+    def _molecule(self, row):
+        mol = None
+        if row.get('sdf'):
+            mol = self._chem.MolFromMolBlock(row['sdf'])
+        if mol is None and row.get('smiles'):
+            mol = self._chem.MolFromSmiles(row['smiles'])
+            if mol is not None:
+                self._depictor.Compute2DCoords(mol)
+        return mol
+
+    def write(self, rows):
+        for row in rows:
+            mol = self._molecule(row)
+            if mol is None:
+                self.skipped += 1
+                continue
+            mol.SetProp("_Name", str(row.get('compound_name') or row.get('iupac') or row.get('cid') or ""))
+            for name in self._columns:
+                if row.get(name) is not None:
+                    mol.SetProp(name, str(row[name]))
+            self._writer.write(mol)
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {'csv': _CsvWriter, 'sdf': _SdfWriter, 'parquet': _ParquetWriter}
+
+
+# Rows without SMILES get null descriptors; an empty string would parse to an
+# empty molecule and come out as zeros
+def _add_descriptors(rows, names):
+    import descriptor_engine
+
+    for row in rows:
+        row.update(dict.fromkeys(names))
+    described = [row for row in rows if row['smiles']]
+    if not described:
+        return
+
+    # Computed in-process: a chunk is already a bounded unit of work
+    table = descriptor_engine.compute_descriptor_table(
+        [row['smiles'] for row in described], names, chunk_size=len(described), max_workers=1
+    )
+    for row, row_values in zip(described, table[names].to_numpy().tolist()):
+        for name, value in zip(names, row_values):
+            row[name] = None if math.isnan(value) else value
+
+
+# Stream one source into a file chunk by chunk: only the chunk being written
+# is ever in memory, whatever the row count. descriptors is a set name from
+# descriptor_engine.DESCRIPTOR_SETS or a list of names; progress(rows) is
+# called after each chunk. Returns the number of rows read.
+def export(source, fmt, path, descriptors=None, chunk_size=CHUNK_SIZE, pool=None, cache=None, progress=None):
+    fields = SOURCES[source]
+    names = []
+    if descriptors:
+        import descriptor_engine
+
+        names = descriptor_engine.resolve_descriptor_names(descriptors)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    writer = WRITERS[fmt](path, fields, names)
+    count = 0
+    try:
+        for chunk in iter_source(source, chunk_size, pool, cache):
+            rows = []
+            for raw in chunk:
+                row = {name: _coerce(raw.get(name), kind) for name, kind in fields}
+                if fmt == 'sdf':
+                    row['sdf'] = raw.get('sdf')
+                rows.append(row)
+            if names:
+                _add_descriptors(rows, names)
+            writer.write(rows)
+            count += len(rows)
+            if progress:
+                progress(count)
+    finally:
+        writer.close()
+    return count
+
+
+# Default file for an export, e.g. .cache/exports/history-20240101-120000.csv
+def export_path(source, fmt):
+    return os.path.join(EXPORT_DIR, f"{source}-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export search history or the compound cache to a file")
+    parser.add_argument("source", choices=list(SOURCES))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--output", help="defaults to a timestamped file in EXPORT_DIR")
+    parser.add_argument("--descriptors", help="descriptor set (basic, drug-likeness, all) or comma-separated names")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    descriptors = None
+    if args.descriptors:
+        import descriptor_engine
+
+        descriptors = descriptor_engine.parse_descriptor_option(args.descriptors)
+
+    output = args.output or export_path(args.source, args.format)
+    start = time.perf_counter()
+    count = export(args.source, args.format, output, descriptors, args.chunk_size,
+                   progress=lambda rows: print(f"\r{rows} rows", end="", file=sys.stderr))
+    print(file=sys.stderr)
+    print(f"Exported {count} rows to {output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
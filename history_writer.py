@@ -0,0 +1,128 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import execute_values
+
+from compound_cache import normalize_query
+
+FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", 50))
+FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 2))
+QUEUE_LIMIT = 10000
+
+# Sessions whose last recorded search is remembered for rerun deduplication
+SESSION_LIMIT = 10000
+
+UPSERT_SQL = """
+    INSERT INTO molecule_history
+    (query_key, compound_name, cid, formula, molecular_weight, smiles, inchi, logp, tpsa, hit_count, searched_at)
+    VALUES %s
+    ON CONFLICT (query_key, cid) DO UPDATE SET
+        compound_name = EXCLUDED.compound_name,
+        hit_count = molecule_history.hit_count + EXCLUDED.hit_count,
+        searched_at = EXCLUDED.searched_at
+"""
+UPSERT_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)"
+
+_STOP = object()
+
+
+# PubChem fills missing numbers with 'N/A', which FLOAT columns reject
+def _number(value):
+    return value if isinstance(value, (int, float)) else None
+
+
+# Queues search history events off the request path and writes them in
+# batches from a background thread. A session re-recording the search it
+# recorded last (i.e. a rerun) is dropped before it reaches the queue.
+class HistoryWriter:
+    def __init__(self, pool, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.pool = pool
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=QUEUE_LIMIT)
+        self._last_recorded = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # Returns True when the event was queued, False for duplicates or a full queue
+    def record(self, session_id, name, data):
+        key = (normalize_query(name), data['cid'])
+        with self._lock:
+            if self._last_recorded.get(session_id) == key:
+                return False
+            self._last_recorded[session_id] = key
+            self._last_recorded.move_to_end(session_id)
+            while len(self._last_recorded) > SESSION_LIMIT:
+                self._last_recorded.popitem(last=False)
+
+        row = (
+            key[0],
+            name,
+            data['cid'],
+            data['formula'],
+            _number(data['weight']),
+            data['smiles'],
+            data.get('inchi', None),
+            _number(data.get('xlogp', None)),
+            _number(data.get('tpsa', None)),
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        batch = []
+        stopping = False
+        while not stopping:
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            if not batch:
+                continue
+            if self._flush(batch):
+                batch = []
+            elif not stopping:
+                # Keep the failed batch for the next attempt, bounded, and back off
+                del batch[:-QUEUE_LIMIT]
+                time.sleep(self.flush_interval)
+
+    # ON CONFLICT cannot touch one row twice per statement, so fold repeats first
+    def _merge(self, rows):
+        merged = OrderedDict()
+        for row in rows:
+            key = (row[0], row[2])
+            hits = merged[key][-1] + 1 if key in merged else 1
+            merged.pop(key, None)
+            merged[key] = row + (hits,)
+        return list(merged.values())
+
+    def _flush(self, rows):
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                execute_values(cur, UPSERT_SQL, self._merge(rows), template=UPSERT_TEMPLATE)
+                conn.commit()
+            return True
+        except Exception:
+            return False
+
+    # Write everything still queued, then stop the background thread
+    def close(self, timeout=10):
+        if self._thread.is_alive():
+            self._queue.put(_STOP, timeout=timeout)
+            self._thread.join(timeout)
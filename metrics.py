@@ -0,0 +1,149 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, Prometheus style
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRIC_NAME = "chemvis_stage_duration_seconds"
+
+_histograms = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    # Estimate a quantile by linear interpolation inside its bucket
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+def observe(stage, seconds, cache='none'):
+    with _lock:
+        histogram = _histograms.setdefault((stage, cache), _Histogram())
+        histogram.observe(seconds)
+
+
+# Time a block of code as one stage of the search pipeline
+@contextmanager
+def span(stage, cache='none'):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, cache)
+
+
+# Called from inside a cached function body when it has to do the real work.
+# A timed call whose body never reports a miss is counted as a cache hit.
+def cache_miss():
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1] = 'miss'
+
+
+# Decorator timing every call of a function. With cached=True it goes outside
+# st.cache_data so cache hits, which never enter the body, are timed too.
+def timed(stage, cached=False):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not cached:
+                with span(stage):
+                    return func(*args, **kwargs)
+
+            stack = _local.__dict__.setdefault("stack", [])
+            stack.append('hit')
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start, stack.pop())
+        return wrapper
+    return decorator
+
+
+# Rows of count, mean and estimated percentiles for the diagnostics panel
+def summary():
+    with _lock:
+        items = sorted(_histograms.items())
+        rows = []
+        for (stage, cache), histogram in items:
+            rows.append({
+                'stage': stage,
+                'cache': cache,
+                'count': histogram.count,
+                'mean_ms': round(1000 * histogram.total / histogram.count, 2),
+                'p50_ms': round(1000 * histogram.quantile(0.5), 2),
+                'p95_ms': round(1000 * histogram.quantile(0.95), 2),
+            })
+    return rows
+
+
+# Prometheus text exposition format
+def render_prometheus():
+    lines = [
+        f"# HELP {METRIC_NAME} Latency of search pipeline stages.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    with _lock:
+        for (stage, cache), histogram in sorted(_histograms.items()):
+            labels = f'stage="{stage}",cache="{cache}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{METRIC_NAME}_sum{{{labels}}} {histogram.total}")
+            lines.append(f"{METRIC_NAME}_count{{{labels}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics for Prometheus scraping from a daemon thread
+def start_http_server(port=None):
+    port = int(port or os.getenv("METRICS_PORT", 0))
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
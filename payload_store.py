@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+DEFAULT_BUDGET_MB = 64
+DEFAULT_TTL = 3600
+COMPRESSION_LEVEL = 6
+
+# Flag byte in front of every stored value
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+
+# Compressed form of a payload: zlib unless that does not make it smaller
+# (PNGs, for example), behind a flag byte. Shared with the shared cache tiers.
+def encode(raw):
+    compressed = zlib.compress(raw, COMPRESSION_LEVEL)
+    if len(compressed) < len(raw):
+        return _ZLIB + compressed
+    return _RAW + raw
+
+
+def decode(stored):
+    if stored[:1] == _ZLIB:
+        return zlib.decompress(stored[1:])
+    return stored[1:]
+
+
+# In-process LRU cache of compressed byte payloads held to a total byte
+# budget, so the memory a replica spends on SDF text, records and images is
+# fixed by configuration instead of by traffic. Values are kept encoded.
+class PayloadStore:
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024, ttl=DEFAULT_TTL):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stored_bytes = 0
+        self.raw_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Why the shared tier this store should have fronted could not be
+        # opened, when open_store fell back to it alone
+        self.shared_error = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            budget_bytes=int(float(os.getenv("PAYLOAD_CACHE_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024),
+            ttl=float(os.getenv("PAYLOAD_CACHE_TTL", DEFAULT_TTL)),
+        )
+
+    def _remove(self, key):
+        stored, raw_size, _ = self._entries.pop(key)
+        self.stored_bytes -= len(stored)
+        self.raw_bytes -= raw_size
+
+    # Bytes for a key, or None when it is missing or expired. Strings put in
+    # come back as bytes; callers decode them.
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[2] is not None and time.monotonic() > entry[2]):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            stored = entry[0]
+        return decode(stored)
+
+    # ttl overrides the store's default for this entry
+    def put(self, key, value, ttl=None):
+        raw = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+        stored = encode(raw)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        # A single payload larger than the whole budget is not kept at all
+        if len(stored) > self.budget_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (stored, len(raw), expires_at)
+            self.stored_bytes += len(stored)
+            self.raw_bytes += len(raw)
+            while self.stored_bytes > self.budget_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Memory use and effectiveness, for the diagnostics panel
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'stored_mb': round(self.stored_bytes / 1024 / 1024, 2),
+                'uncompressed_mb': round(self.raw_bytes / 1024 / 1024, 2),
+                'budget_mb': round(self.budget_bytes / 1024 / 1024, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'shared_error': self.shared_error,
+            }
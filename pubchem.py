@@ -0,0 +1,545 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import quote
+
+import pubchempy as pcp
+import requests
+from requests.adapters import HTTPAdapter
+
+from singleflight import SingleFlight
+
+PUBCHEM_BASE_URL = os.getenv("PUBCHEM_BASE_URL", "https://pubchem.ncbi.nlm.nih.gov/rest/pug")
+
+# Overall time budget for one search, shared by every request it makes
+SEARCH_DEADLINE = float(os.getenv("PUBCHEM_SEARCH_DEADLINE", 15))
+
+# PubChem asks clients to stay at or below five requests per second
+RATE_LIMIT = float(os.getenv("PUBCHEM_RATE_LIMIT", 5))
+
+# Set to make the rate limit apply to all replicas together instead of to
+# each process: a SQLite file for replicas on one host, or a Postgres URL for
+# replicas on several hosts. The SQLite file is in WAL mode, which needs
+# shared memory and so must never sit on a network filesystem.
+RATE_LIMIT_DB = os.getenv("PUBCHEM_RATE_LIMIT_DB")
+
+# Throttled (429) and busy (503) responses are retried with exponential
+# backoff and jitter, honouring Retry-After
+MAX_RETRIES = int(os.getenv("PUBCHEM_MAX_RETRIES", 3))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+RETRY_STATUSES = (429, 503)
+
+# After this many consecutive failures, stop calling PubChem for a while
+BREAKER_THRESHOLD = int(os.getenv("PUBCHEM_BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.getenv("PUBCHEM_BREAKER_RESET", 30))
+
+MAX_CONNECTIONS = 16
+
+# CIDs sent per property-table request in batch mode
+BATCH_SIZE = 100
+
+# PubChem property names and the keys get_molecule_data uses for them
+PROPERTY_FIELDS = {
+    'MolecularFormula': 'formula',
+    'MolecularWeight': 'weight',
+    'IUPACName': 'iupac',
+    'CanonicalSMILES': 'smiles',
+    'InChI': 'inchi',
+    'InChIKey': 'inchikey',
+    'XLogP': 'xlogp',
+    'TPSA': 'tpsa',
+    'Complexity': 'complexity',
+    'HBondDonorCount': 'h_bond_donor',
+    'HBondAcceptorCount': 'h_bond_acceptor',
+    'RotatableBondCount': 'rotatable_bonds',
+}
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix="pubchem")
+
+
+# Token bucket shared by every request the process sends to PubChem
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+# The same token bucket kept in a SQLite row, so every process on the host
+# using the file draws from one budget. If the file cannot be used, requests
+# fall back to the process-local bucket rather than stall.
+class SharedRateLimiter:
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path, rate, burst=None):
+        self.path = path
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self._local = threading.local()
+        self._fallback = RateLimiter(rate, burst)
+
+    # Tokens left after one is taken from a bucket last seen holding tokens at
+    # updated, and the seconds to wait when there was none to take
+    def _refill(self, tokens, updated, now):
+        tokens = min(self.capacity, tokens + max(now - updated, 0) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, (1 - tokens) / self.rate
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def _take(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_limit WHERE name = 'pubchem'").fetchone()
+            # Wall-clock time, since the bucket is shared between processes
+            now = time.time()
+            tokens, wait_for = self._refill(*(row or (self.capacity, now)), now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit (name, tokens, updated) VALUES ('pubchem', ?, ?)",
+                (tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait_for
+
+    def acquire(self):
+        while True:
+            try:
+                wait_for = self._take()
+            except self.errors:
+                self._fallback.acquire()
+                return
+            if not wait_for:
+                return
+            time.sleep(wait_for)
+
+
+RATE_LIMIT_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS pubchem_rate_limit (
+        name TEXT PRIMARY KEY,
+        tokens DOUBLE PRECISION NOT NULL,
+        updated DOUBLE PRECISION NOT NULL
+    );
+    -- An empty bucket last updated at the epoch refills to capacity at once
+    INSERT INTO pubchem_rate_limit (name, tokens, updated)
+    VALUES ('pubchem', 0, 0)
+    ON CONFLICT (name) DO NOTHING;
+"""
+
+
+# The token bucket in a Postgres row, for replicas on several hosts. The
+# row is locked while a token is taken, and the database's clock is used so
+# hosts with drifting clocks still agree on the refill.
+class PostgresRateLimiter(SharedRateLimiter):
+    errors = (Exception,)
+
+    def __init__(self, dsn, rate, burst=None):
+        super().__init__(None, rate, burst)
+        self.dsn = dsn
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                import db
+
+                pool = db.ConnectionPool(self.dsn, maxconn=4, checkout_timeout=1)
+                try:
+                    db.ensure_schema(pool, RATE_LIMIT_TABLE_SQL)
+                except Exception:
+                    pool.close()
+                    raise
+                self._pool = pool
+            return self._pool
+
+    def _take(self):
+        with self._get_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT tokens, updated, extract(epoch FROM clock_timestamp())
+                FROM pubchem_rate_limit WHERE name = 'pubchem' FOR UPDATE
+            """)
+            tokens, updated, now = (float(value) for value in cur.fetchone())
+            tokens, wait_for = self._refill(tokens, updated, now)
+            cur.execute(
+                "UPDATE pubchem_rate_limit SET tokens = %s, updated = %s WHERE name = 'pubchem'",
+                (tokens, now),
+            )
+            conn.commit()
+        return wait_for
+
+
+if RATE_LIMIT_DB and RATE_LIMIT_DB.startswith(("postgres://", "postgresql://")):
+    rate_limiter = PostgresRateLimiter(RATE_LIMIT_DB, RATE_LIMIT)
+elif RATE_LIMIT_DB:
+    rate_limiter = SharedRateLimiter(RATE_LIMIT_DB, RATE_LIMIT)
+else:
+    rate_limiter = RateLimiter(RATE_LIMIT)
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+# Stops sending requests after repeated failures. Once reset_timeout has
+# passed, a single trial request is let through; its outcome closes the
+# breaker again or restarts the wait.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def retry_in(self):
+        if self._opened_at is None:
+            return 0
+        return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+breaker = CircuitBreaker()
+
+
+# Keep-alive HTTP session reused by every PubChem request in the process
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _backoff_delay(attempt, response):
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX))
+
+
+# Send one request through the rate limiter, retrying throttled and busy
+# responses within the timeout
+def _send(method, url, timeout, data=None):
+    give_up_at = time.monotonic() + timeout
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response = get_session().request(
+            method, url, data=data, timeout=max(give_up_at - time.monotonic(), 0.1)
+        )
+        if response.status_code not in RETRY_STATUSES:
+            break
+        delay = _backoff_delay(attempt, response)
+        if attempt == MAX_RETRIES or time.monotonic() + delay >= give_up_at:
+            break
+        time.sleep(delay)
+    return response
+
+
+# _send behind the circuit breaker. Anything below 500 other than 429,
+# including 404, counts as PubChem being healthy. Every way out records an
+# outcome, so a trial request that raises, even from the rate limiter, never
+# leaves the breaker half-open.
+def _request(method, url, timeout, data=None):
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"PubChem is unavailable, retrying in {breaker.retry_in():.0f}s")
+
+    try:
+        response = _send(method, url, timeout, data)
+    except BaseException:
+        breaker.record_failure()
+        raise
+
+    if response.status_code >= 500 or response.status_code == 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+# Identical GETs in flight at the same time (the same SDF or image wanted by
+# several sessions during a burst) share one upstream request
+flights = SingleFlight()
+
+
+def _get_once(url, timeout):
+    response = _request("GET", url, timeout)
+    # Read the body here so the callers sharing the response never race on it
+    response.content
+    return response
+
+
+def _get(url, timeout):
+    return flights.do(url, lambda: _get_once(url, timeout))
+
+
+def _post(url, data, timeout):
+    return _request("POST", url, timeout, data=data)
+
+
+def compound_url(name):
+    return f"{PUBCHEM_BASE_URL}/compound/name/{quote(str(name), safe='')}/JSON"
+
+
+def compound_cid_url(cid):
+    return f"{PUBCHEM_BASE_URL}/compound/cid/{cid}/JSON"
+
+
+def sdf_url(cid):
+    return f"{PUBCHEM_BASE_URL}/compound/cid/{cid}/SDF?record_type=3d"
+
+
+def image_url(cid, image_type='2d'):
+    url = f"{PUBCHEM_BASE_URL}/compound/cid/{cid}/PNG?image_size=large"
+    if image_type == '3d':
+        url += "&image_type=3d"
+    return url
+
+
+def new_deadline(seconds=SEARCH_DEADLINE):
+    return time.monotonic() + seconds
+
+
+def _remaining(deadline):
+    return max(deadline - time.monotonic(), 0.1)
+
+
+# Responses of a fetch stage, plus the requests that failed or ran out of time
+class FetchResult:
+    def __init__(self):
+        self.responses = {}
+        self.errors = {}
+
+    # Body of a successful response, or None when missing or failed
+    def content(self, key):
+        response = self.responses.get(key)
+        if response is not None and response.status_code == 200:
+            return response.content
+        return None
+
+    def text(self, key):
+        response = self.responses.get(key)
+        if response is not None and response.status_code == 200:
+            return response.text
+        return None
+
+
+# Run independent GET requests concurrently, all bounded by one deadline
+def fetch_all(urls, deadline=None):
+    if deadline is None:
+        deadline = new_deadline()
+
+    futures = {
+        _executor.submit(_get, url, _remaining(deadline)): key
+        for key, url in urls.items()
+    }
+    done, pending = wait(futures, timeout=_remaining(deadline))
+
+    result = FetchResult()
+    for future in done:
+        key = futures[future]
+        try:
+            result.responses[key] = future.result()
+        except Exception as e:
+            result.errors[key] = str(e)
+    for future in pending:
+        future.cancel()
+        result.errors[futures[future]] = "timed out"
+    return result
+
+
+# Translate a pubchempy Compound into the dict used throughout the app
+def compound_to_data(compound):
+    mol_data = {
+        'cid': compound.cid,
+        'formula': compound.molecular_formula,
+        'weight': compound.molecular_weight,
+        'iupac': compound.iupac_name if compound.iupac_name else 'N/A',
+        'smiles': compound.canonical_smiles if compound.canonical_smiles else 'N/A',
+        'inchi': compound.inchi if compound.inchi else 'N/A',
+        'inchikey': compound.inchikey if compound.inchikey else 'N/A',
+    }
+
+    # Get additional properties if available
+    try:
+        mol_data['xlogp'] = compound.xlogp if compound.xlogp else 'N/A'
+        mol_data['tpsa'] = compound.tpsa if compound.tpsa else 'N/A'
+        mol_data['complexity'] = compound.complexity if compound.complexity else 'N/A'
+        mol_data['h_bond_donor'] = compound.h_bond_donor_count if compound.h_bond_donor_count else 'N/A'
+        mol_data['h_bond_acceptor'] = compound.h_bond_acceptor_count if compound.h_bond_acceptor_count else 'N/A'
+        mol_data['rotatable_bonds'] = compound.rotatable_bond_count if compound.rotatable_bond_count else 'N/A'
+    except:
+        pass
+
+    return mol_data
+
+
+# Resolve a name to its PubChem record, then fetch the 3D SDF. A CID known
+# from the local synonym index (or a digit-only query) skips PubChem's
+# slower name search and lets the record and SDF be fetched concurrently.
+# Returns None when PubChem does not know the name.
+def fetch_molecule_data(name, deadline=None, cid=None):
+    if deadline is None:
+        deadline = new_deadline()
+
+    response = None
+    assets = None
+    if cid is not None:
+        # With the CID known up front, the record and its 3D SDF are fetched together
+        assets = fetch_all({'record': compound_cid_url(cid), 'sdf': sdf_url(cid)}, deadline)
+        if 'record' in assets.errors:
+            raise requests.RequestException(assets.errors['record'])
+        response = assets.responses['record']
+        if response.status_code == 404:
+            response = assets = None
+    if response is None:
+        response = _get(compound_url(name), _remaining(deadline))
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    records = response.json().get('PC_Compounds') or []
+    if not records:
+        return None
+
+    mol_data = compound_to_data(pcp.Compound(records[0]))
+    if assets is None or mol_data['cid'] != cid:
+        assets = fetch_all({'sdf': sdf_url(mol_data['cid'])}, deadline)
+    mol_data['sdf'] = assets.text('sdf')
+    mol_data['fetch_errors'] = {key: error for key, error in assets.errors.items() if key == 'sdf'}
+    return mol_data
+
+
+# Fetch one PNG depiction of a CID, or None when PubChem has none (404).
+# Timeouts and other failures raise, so they are never mistaken for a
+# missing image.
+def fetch_image(cid, image_type='2d', deadline=None):
+    assets = fetch_all({'image': image_url(cid, image_type)}, deadline)
+    if 'image' in assets.errors:
+        raise requests.RequestException(assets.errors['image'])
+    response = assets.responses['image']
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+# Resolve a name or SMILES to its first CID, or None when PubChem has no match
+def resolve_cid(identifier, kind='name', timeout=10):
+    if kind == 'cid':
+        return int(identifier)
+    if kind == 'smiles':
+        response = _post(f"{PUBCHEM_BASE_URL}/compound/smiles/cids/TXT", {'smiles': identifier}, timeout)
+    else:
+        response = _get(f"{PUBCHEM_BASE_URL}/compound/name/{quote(str(identifier), safe='')}/cids/TXT", timeout)
+
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    cids = response.text.split()
+    if not cids or cids[0] == '0':
+        return None
+    return int(cids[0])
+
+
+# Translate one PropertyTable row into the fields get_molecule_data produces
+def property_row_to_data(row):
+    mol_data = {'cid': row['CID']}
+    for prop, field in PROPERTY_FIELDS.items():
+        value = row.get(prop)
+        # PubChem now reports canonical SMILES as ConnectivitySMILES
+        if value is None and prop == 'CanonicalSMILES':
+            value = row.get('ConnectivitySMILES')
+        mol_data[field] = value if value is not None else 'N/A'
+    if mol_data['weight'] != 'N/A':
+        mol_data['weight'] = float(mol_data['weight'])
+    return mol_data
+
+
+# Fetch the property table for many CIDs in one request, keyed by CID
+def fetch_properties(cids, timeout=30):
+    if not cids:
+        return {}
+    response = _post(
+        f"{PUBCHEM_BASE_URL}/compound/cid/property/{','.join(PROPERTY_FIELDS)}/JSON",
+        {'cid': ','.join(str(cid) for cid in cids)},
+        timeout,
+    )
+    if response.status_code == 404:
+        return {}
+    response.raise_for_status()
+
+    rows = response.json().get('PropertyTable', {}).get('Properties', [])
+    return {row['CID']: property_row_to_data(row) for row in rows}
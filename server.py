@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from core import MoleculeService
+
+HOST = os.getenv("CORE_SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("CORE_SERVER_PORT", 8600))
+
+# Lookups running at once; further requests wait their turn
+CONCURRENCY = int(os.getenv("CORE_SERVER_CONCURRENCY", 16))
+
+# Largest request body accepted, and most queries in one batch
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH = 1000
+
+# Seconds a client may take to send its request
+READ_TIMEOUT = 10
+
+# Pixel bounds of a requested image size; larger canvases would tie up the
+# shared thread pool and its memory
+MIN_IMAGE_SIZE = 64
+MAX_IMAGE_SIZE = 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           408: "Request Timeout", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Minimal HTTP/1.1 server over asyncio streams, one request per connection.
+# Handlers are coroutines; the blocking lookup and RDKit work runs on a
+# thread pool sized to the concurrency limit.
+#
+#   GET  /health
+#   GET  /stats
+#   GET  /compound?name=aspirin[&descriptors=basic][&sdf=1]
+#   GET  /descriptors?smiles=CCO[&set=basic]
+#   GET  /image?name=aspirin[&kind=2d|3d][&size=64..1024] -> image/png
+#   POST /batch {"queries": [...], "descriptors": "basic"}  -> JSONL in input order
+class CoreServer:
+    def __init__(self, service, concurrency=CONCURRENCY):
+        self.service = service
+        self._limit = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="core-server")
+        self._routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/stats'): self.stats,
+            ('GET', '/compound'): self.compound,
+            ('GET', '/descriptors'): self.descriptors,
+            ('GET', '/image'): self.image,
+            ('POST', '/batch'): self.batch,
+        }
+
+    async def _run(self, function, *args):
+        async with self._limit:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def health(self, params, body, writer):
+        self._send_json(writer, 200, {'status': 'ok'})
+
+    # Payload cache hit and miss counters, per tier when tiered
+    async def stats(self, params, body, writer):
+        self._send_json(writer, 200, self.service.store.stats())
+
+    async def compound(self, params, body, writer):
+        name = params.get('name')
+        if not name:
+            raise HttpError(400, "name is required")
+        result = await self._run(self.service.resolve, name, params.get('descriptors'), params.get('sdf') == '1')
+        self._send_json(writer, 404 if result.get('error') == "not found" else 200, result)
+
+    async def descriptors(self, params, body, writer):
+        smiles = params.get('smiles')
+        if not smiles:
+            raise HttpError(400, "smiles is required")
+        try:
+            values = await self._run(self.service.describe, smiles, params.get('set', 'basic'))
+        except (KeyError, ValueError) as e:
+            raise HttpError(400, f"unknown descriptors: {e}")
+        if not values:
+            raise HttpError(400, "could not parse SMILES")
+        self._send_json(writer, 200, {'smiles': smiles, 'descriptors': values})
+
+    async def image(self, params, body, writer):
+        name = params.get('name')
+        kind = params.get('kind', '2d')
+        if not name or kind not in ('2d', '3d'):
+            raise HttpError(400, "name is required and kind must be 2d or 3d")
+        size = params.get('size')
+        if size is not None:
+            if not size.isdigit() or not MIN_IMAGE_SIZE <= int(size) <= MAX_IMAGE_SIZE:
+                raise HttpError(400, f"size must be between {MIN_IMAGE_SIZE} and {MAX_IMAGE_SIZE}")
+            size = int(size)
+
+        data = await self._run(self.service.lookup, name)
+        if not data:
+            raise HttpError(404, "not found")
+        png = await self._run(self.service.image, data['cid'], kind, data['smiles'], data.get('sdf'), size)
+        if not png:
+            raise HttpError(404, "no image available")
+        self._send(writer, 200, "image/png", png)
+
+    # Results are written as each one is ready, in input order
+    async def batch(self, params, body, writer):
+        try:
+            request = json.loads(body or b"{}")
+            queries = [str(query) for query in request['queries']]
+        except (ValueError, KeyError, TypeError):
+            raise HttpError(400, 'body must be {"queries": [...]}')
+        if len(queries) > MAX_BATCH:
+            raise HttpError(413, f"at most {MAX_BATCH} queries per batch")
+
+        descriptors = request.get('descriptors')
+        tasks = [asyncio.ensure_future(self._run(self.service.resolve, query, descriptors)) for query in queries]
+        self._start(writer, 200, "application/x-ndjson")
+        try:
+            for task in tasks:
+                writer.write((json.dumps(await task) + "\n").encode("utf-8"))
+                await writer.drain()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _start(self, writer, status, content_type, length=None):
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                "Connection: close"]
+        if length is not None:
+            head.append(f"Content-Length: {length}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+    def _send(self, writer, status, content_type, body):
+        self._start(writer, status, content_type, len(body))
+        writer.write(body)
+
+    def _send_json(self, writer, status, payload):
+        self._send(writer, status, "application/json", json.dumps(payload).encode("utf-8"))
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise HttpError(400, "malformed request line")
+        method, target, _ = request_line
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "request body too large")
+        body = await reader.readexactly(length) if length else b""
+
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return method, url.path, params, body
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, path, params, body = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+                handler = self._routes.get((method, path))
+                if handler is None:
+                    known = any(route_path == path for _, route_path in self._routes)
+                    raise HttpError(405 if known else 404, f"{method} {path} is not supported")
+                await handler(params, body, writer)
+            except HttpError as e:
+                self._send_json(writer, e.status, {'error': str(e)})
+            except asyncio.TimeoutError:
+                self._send_json(writer, 408, {'error': "request not received in time"})
+            except (ValueError, asyncio.IncompleteReadError):
+                self._send_json(writer, 400, {'error': "malformed request"})
+            except Exception as e:
+                self._send_json(writer, 500, {'error': str(e)})
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve compound lookups and descriptors over local HTTP")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    print(f"Serving on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(CoreServer(MoleculeService.from_env(), args.concurrency).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
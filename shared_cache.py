@@ -0,0 +1,261 @@
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from payload_store import PayloadStore, decode, encode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(".cache", "shared.sqlite3")
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 200000
+
+# Expired and overflowing entries are purged once every this many writes
+PURGE_EVERY = 500
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+# Payload store in a SQLite file every replica on the host reads and writes.
+# The file is in WAL mode, which relies on shared memory: it must be on local
+# disk, never on NFS or another network filesystem shared across hosts (use
+# PostgresStore for that). Same get/put/stats interface as PayloadStore; a
+# failing read is a miss and a failing write is dropped.
+class SqliteStore:
+    backend = 'sqlite'
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.counters = _Counters()
+        self._writes = itertools.count(1)
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS payloads (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS payloads_expires_at ON payloads (expires_at);
+        """)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("SHARED_CACHE_PATH", DEFAULT_PATH),
+            ttl=float(os.getenv("SHARED_CACHE_TTL", DEFAULT_TTL)),
+            max_entries=int(os.getenv("SHARED_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+
+    # One connection per thread; sqlite connections must not cross threads
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        return self.get_with_ttl(key)[0]
+
+    # (value, seconds until it expires), the seconds None for no expiry;
+    # (None, None) on a miss
+    def get_with_ttl(self, key):
+        now = time.time()
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM payloads WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+        except sqlite3.Error:
+            self.counters.count('errors')
+            return None, None
+        if row is None:
+            self.counters.count('misses')
+            return None, None
+        self.counters.count('hits')
+        return decode(bytes(row[0])), row[1] - now if row[1] is not None else None
+
+    def put(self, key, value, ttl=None):
+        raw = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO payloads (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, encode(raw), time.time() + ttl if ttl else None),
+            )
+            if next(self._writes) % PURGE_EVERY == 0:
+                self._purge(conn)
+        except sqlite3.Error:
+            self.counters.count('errors')
+
+    # Expired entries first, then the ones closest to expiry beyond max_entries
+    def _purge(self, conn):
+        conn.execute("DELETE FROM payloads WHERE expires_at <= ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM payloads").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute("""
+                DELETE FROM payloads WHERE key IN (
+                    SELECT key FROM payloads ORDER BY expires_at ASC LIMIT ?
+                )
+            """, (overflow,))
+
+    def stats(self):
+        return {'backend': self.backend, **self.counters.stats()}
+
+
+PAYLOAD_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS payload_cache (
+        key TEXT PRIMARY KEY,
+        value BYTEA NOT NULL,
+        expires_at TIMESTAMPTZ
+    );
+    CREATE INDEX IF NOT EXISTS payload_cache_expires_at_idx ON payload_cache (expires_at);
+"""
+
+
+# Payload store in a Postgres table, for replicas on different hosts. Uses
+# the app's connection pool; like SqliteStore, failures count as misses. The
+# table is created under the migration lock, so replicas starting together
+# do not race on the catalog.
+class PostgresStore:
+    backend = 'postgres'
+
+    def __init__(self, pool, ttl=DEFAULT_TTL):
+        self.pool = pool
+        self.ttl = ttl
+        self.counters = _Counters()
+        self._writes = itertools.count(1)
+        import db
+
+        db.ensure_schema(pool, PAYLOAD_TABLE_SQL)
+
+    @classmethod
+    def from_env(cls, pool):
+        return cls(pool, ttl=float(os.getenv("SHARED_CACHE_TTL", DEFAULT_TTL)))
+
+    def get(self, key):
+        return self.get_with_ttl(key)[0]
+
+    # Same as SqliteStore.get_with_ttl
+    def get_with_ttl(self, key):
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT value, EXTRACT(EPOCH FROM expires_at - now()) FROM payload_cache
+                    WHERE key = %s AND (expires_at IS NULL OR expires_at > now())
+                """, (key,))
+                row = cur.fetchone()
+        except Exception:
+            self.counters.count('errors')
+            return None, None
+        if row is None:
+            self.counters.count('misses')
+            return None, None
+        self.counters.count('hits')
+        return decode(bytes(row[0])), float(row[1]) if row[1] is not None else None
+
+    def put(self, key, value, ttl=None):
+        import psycopg2
+
+        raw = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO payload_cache (key, value, expires_at)
+                    VALUES (%s, %s, CASE WHEN %s > 0 THEN now() + %s * interval '1 second' END)
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = excluded.value,
+                        expires_at = excluded.expires_at
+                """, (key, psycopg2.Binary(encode(raw)), ttl, ttl))
+                if next(self._writes) % PURGE_EVERY == 0:
+                    cur.execute("DELETE FROM payload_cache WHERE expires_at <= now()")
+                conn.commit()
+        except Exception:
+            self.counters.count('errors')
+
+    def stats(self):
+        return {'backend': self.backend, **self.counters.stats()}
+
+
+# A fast in-process tier in front of a shared one. Reads fall through to the
+# shared tier and promote what they find, for no longer than the shared entry
+# has left (a short-lived entry stays short-lived); writes go to both. A
+# replica thus starts warm from what every other replica has already fetched
+# or rendered.
+class TieredStore:
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+        self.counters = _Counters()
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None:
+            value, remaining = self.shared.get_with_ttl(key)
+            if value is not None:
+                if remaining is not None and self.local.ttl and remaining >= self.local.ttl:
+                    remaining = None
+                self.local.put(key, value, remaining)
+        self.counters.count('misses' if value is None else 'hits')
+        return value
+
+    def put(self, key, value, ttl=None):
+        self.local.put(key, value, ttl)
+        self.shared.put(key, value, ttl)
+
+    # Overall counters, with each tier's own underneath
+    def stats(self):
+        return {**self.counters.stats(), 'local': self.local.stats(), 'shared': self.shared.stats()}
+
+
+# The payload store selected by SHARED_CACHE: unset for in-process only,
+# 'sqlite' for a file on this host's disk, 'postgres' for a table reached
+# through pool. An unusable shared tier falls back to in-process only, with
+# a warning logged and the reason kept in the store's stats.
+def open_store(pool=None):
+    local = PayloadStore.from_env()
+    backend = os.getenv("SHARED_CACHE", "").lower()
+    try:
+        if backend == 'sqlite':
+            return TieredStore(local, SqliteStore.from_env())
+        if backend == 'postgres':
+            if pool is None:
+                raise ValueError("SHARED_CACHE=postgres needs DB_URL")
+            return TieredStore(local, PostgresStore.from_env(pool))
+    except Exception as e:
+        logger.warning("Shared %s cache unavailable, caching in-process only: %s", backend, e)
+        local.shared_error = f"{backend}: {e}"
+    return local
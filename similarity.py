@@ -0,0 +1,286 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from rdkit import Chem, DataStructs, RDLogger
+from rdkit.Chem import rdFingerprintGenerator
+
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", os.path.join(".cache", "similarity"))
+
+FP_BITS = 2048
+FP_WORDS = FP_BITS // 64
+
+# Rows scanned per vectorized step; bounds temporary memory during a search
+BLOCK_ROWS = 65536
+
+# Seconds between saves of an index the feeder is changing
+SAVE_INTERVAL = 60
+QUEUE_LIMIT = 10000
+
+_morgan_generator = rdFingerprintGenerator.GetMorganGenerator(radius=2, fpSize=FP_BITS)
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.uint32)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        return _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=1, dtype=np.uint32)
+
+
+def _pack(bits):
+    return np.packbits(bits.astype(np.uint8)).view(np.uint64)
+
+
+def morgan_fingerprint(mol):
+    return _pack(_morgan_generator.GetFingerprintAsNumPy(mol))
+
+
+# Pattern fingerprints set every bit a substructure of the molecule would set,
+# so (fp & query) == query is a safe screen before the exact match
+def pattern_fingerprint(mol):
+    bits = np.zeros(FP_BITS, dtype=np.uint8)
+    DataStructs.ConvertToNumpyArray(Chem.PatternFingerprint(mol, fpSize=FP_BITS), bits)
+    return _pack(bits)
+
+
+# Append-only 2D array with amortized O(1) row appends
+class _GrowableRows:
+    def __init__(self, width, dtype):
+        self._rows = np.zeros((16, width), dtype=dtype) if width else np.zeros(16, dtype=dtype)
+        self.size = 0
+
+    def append(self, row):
+        if self.size == len(self._rows):
+            grown = np.zeros((len(self._rows) * 2,) + self._rows.shape[1:], dtype=self._rows.dtype)
+            grown[:self.size] = self._rows[:self.size]
+            self._rows = grown
+        self._rows[self.size] = row
+        self.size += 1
+
+    def view(self):
+        return self._rows[:self.size]
+
+
+# Packed Morgan and pattern fingerprints for every compound the app has seen.
+# A saved index is loaded (optionally memory-mapped) as a read-only base segment;
+# compounds added afterwards go to an in-memory segment until the next save.
+class FingerprintIndex:
+    def __init__(self):
+        self.smiles = []
+        self.names = []
+        self.cids = []
+        # Highest search history id already backfilled into the index
+        self.history_id = 0
+        self._positions = {}
+        self._base = (
+            np.zeros((0, FP_WORDS), dtype=np.uint64),
+            np.zeros((0, FP_WORDS), dtype=np.uint64),
+            np.zeros(0, dtype=np.uint32),
+        )
+        self._new = (
+            _GrowableRows(FP_WORDS, np.uint64),
+            _GrowableRows(FP_WORDS, np.uint64),
+            _GrowableRows(0, np.uint32),
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.smiles)
+
+    def __contains__(self, smiles):
+        return smiles in self._positions
+
+    # Add one compound; returns False for duplicates and unparsable SMILES
+    def add(self, smiles, name=None, cid=None):
+        if not smiles or smiles == 'N/A' or smiles in self._positions:
+            return False
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            return False
+
+        morgan = morgan_fingerprint(mol)
+        pattern = pattern_fingerprint(mol)
+        with self._lock:
+            if smiles in self._positions:
+                return False
+            new_morgan, new_pattern, new_counts = self._new
+            new_morgan.append(morgan)
+            new_pattern.append(pattern)
+            new_counts.append(_popcount(morgan[None, :])[0])
+            self._positions[smiles] = len(self.smiles)
+            self.smiles.append(smiles)
+            self.names.append(name)
+            self.cids.append(int(cid) if cid is not None else None)
+        return True
+
+    def add_many(self, rows):
+        RDLogger.DisableLog('rdApp.*')
+        try:
+            return sum(self.add(smiles, name, cid) for smiles, name, cid in rows)
+        finally:
+            RDLogger.EnableLog('rdApp.*')
+
+    def _segments(self):
+        with self._lock:
+            base_morgan, base_pattern, base_counts = self._base
+            new_morgan, new_pattern, new_counts = (rows.view() for rows in self._new)
+        yield 0, base_morgan, base_pattern, base_counts
+        yield len(base_counts), new_morgan, new_pattern, new_counts
+
+    def _result(self, row, **extra):
+        return {'name': self.names[row], 'cid': self.cids[row], 'smiles': self.smiles[row], **extra}
+
+    # Top-k compounds by Tanimoto similarity of Morgan fingerprints
+    def search_similar(self, smiles, k=10, threshold=0.0):
+        mol = Chem.MolFromSmiles(smiles) if smiles else None
+        if mol is None or not len(self):
+            return []
+        query = morgan_fingerprint(mol)
+        query_count = _popcount(query[None, :])[0]
+
+        scores = []
+        for offset, morgan, _, counts in self._segments():
+            for start in range(0, len(counts), BLOCK_ROWS):
+                block = morgan[start:start + BLOCK_ROWS]
+                common = _popcount(block & query)
+                union = counts[start:start + BLOCK_ROWS] + query_count - common
+                scores.append(np.where(union > 0, common / np.maximum(union, 1), 0.0))
+        scores = np.concatenate(scores)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            self._result(int(row), similarity=round(float(scores[row]), 3))
+            for row in top if scores[row] >= threshold
+        ]
+
+    # Compounds containing a SMILES or SMARTS query, screened by pattern fingerprint
+    def search_substructure(self, query, limit=50):
+        pattern_mol = Chem.MolFromSmiles(query) if query else None
+        if pattern_mol is None and query:
+            pattern_mol = Chem.MolFromSmarts(query)
+        if pattern_mol is None or not len(self):
+            return []
+        screen = pattern_fingerprint(pattern_mol)
+
+        matches = []
+        for offset, _, pattern, counts in self._segments():
+            for start in range(0, len(counts), BLOCK_ROWS):
+                block = pattern[start:start + BLOCK_ROWS]
+                candidates = np.flatnonzero(((block & screen) == screen).all(axis=1))
+                for row in candidates + offset + start:
+                    mol = Chem.MolFromSmiles(self.smiles[row])
+                    if mol is not None and mol.HasSubstructMatch(pattern_mol):
+                        matches.append(self._result(int(row)))
+                        if len(matches) >= limit:
+                            return matches
+        return matches
+
+    def save(self, directory=SIMILARITY_INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        arrays = {}
+        with self._lock:
+            for name, base, new in zip(("morgan", "pattern", "counts"), self._base, self._new):
+                arrays[name] = np.concatenate([base, new.view()])
+            meta = {'smiles': list(self.smiles), 'names': list(self.names), 'cids': list(self.cids),
+                    'history_id': self.history_id}
+
+        for name, array in arrays.items():
+            tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        tmp_path = os.path.join(directory, "meta.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def load(cls, directory=SIMILARITY_INDEX_DIR, mmap=True):
+        index = cls()
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            return index
+
+        mode = "r" if mmap else None
+        index._base = tuple(
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+            for name in ("morgan", "pattern", "counts")
+        )
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        index.smiles = meta['smiles']
+        index.names = meta['names']
+        index.cids = meta['cids']
+        index.history_id = meta.get('history_id', 0)
+        index._positions = {smiles: row for row, smiles in enumerate(index.smiles)}
+        return index
+
+
+# Adds compounds to an index from a background thread, so fingerprinting
+# never runs on the request path. The thread first works through backfill(after_id),
+# chunks of (history id, smiles, name, cid) rows the index has not seen,
+# then takes compounds submitted as they are searched or imported. A
+# changing index is saved at most every save_interval seconds and at exit.
+class IndexFeeder:
+    def __init__(self, index, backfill=None, save_interval=SAVE_INTERVAL):
+        self.index = index
+        self.save_interval = save_interval
+        self._backfill = backfill
+        self._queue = queue.Queue(maxsize=QUEUE_LIMIT)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._save_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="similarity-feeder", daemon=True)
+        self._thread.start()
+        atexit.register(self.save)
+
+    # Returns False when the queue is full and the compound was dropped
+    def submit(self, smiles, name=None, cid=None):
+        try:
+            self._queue.put_nowait((smiles, name, cid))
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        if self._backfill:
+            try:
+                for chunk in self._backfill(self.index.history_id):
+                    self.index.add_many((smiles, name, cid) for _, smiles, name, cid in chunk)
+                    self.index.history_id = max(self.index.history_id, chunk[-1][0])
+                    self._dirty = True
+                    self._save_if_due()
+            except Exception:
+                pass
+
+        while True:
+            try:
+                smiles, name, cid = self._queue.get(timeout=self.save_interval)
+                if self.index.add(smiles, name, cid):
+                    self._dirty = True
+            except queue.Empty:
+                pass
+            except Exception:
+                continue
+            self._save_if_due()
+
+    def _save_if_due(self):
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        with self._save_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._saved_at = time.monotonic()
+            try:
+                self.index.save()
+            except OSError:
+                self._dirty = True
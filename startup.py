@@ -0,0 +1,60 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Wall-clock time of each one-off startup step: lazy imports, schema setup,
+# index loading, measured from when this module was first imported. Only the
+# first run of a step is recorded, so the report shows what a cold process
+# paid before it could serve. Lazy imports are plain function-local imports
+# wrapped in phase("import <module>").
+PROCESS_START = time.perf_counter()
+
+_timings = {}
+_lock = threading.Lock()
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        # Repeat runs, e.g. an import that is already done, are not recorded
+        if name not in _timings:
+            with _lock:
+                _timings.setdefault(name, (start - PROCESS_START, elapsed))
+
+
+# Rows of startup steps in the order they happened, for the diagnostics panel
+def report():
+    with _lock:
+        items = sorted(_timings.items(), key=lambda item: item[1][0])
+    return [
+        {'step': name, 'at_ms': round(1000 * offset, 1), 'duration_ms': round(1000 * elapsed, 1)}
+        for name, (offset, elapsed) in items
+    ]
+
+
+# Render the app once, as a fresh replica would on its first request, and
+# print where the time went
+def main():
+    from streamlit.testing.v1 import AppTest
+
+    # The app records into the importable module, not this __main__ copy
+    registry = importlib.import_module("startup")
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+    with registry.phase("first render"):
+        at = AppTest.from_file(app_path, default_timeout=60)
+        at.run()
+
+    for row in registry.report():
+        print(f"{row['step']:40} at {row['at_ms']:>8} ms   took {row['duration_ms']:>8} ms")
+    return 1 if at.exception else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,20 @@
+import startup
 import streamlit as st
-import py3Dmol
-from stmol import showmol
-from streamlit_ketcher import st_ketcher
-import pubchempy as pcp
-from rdkit import Chem
-from rdkit.Chem import Descriptors, AllChem
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
+import sys
+import threading
+import uuid
+import metrics
 from datetime import datetime
-import time
-from PIL import Image
-from io import BytesIO
-import requests
-import pandas as pd
+import core
+import export
+from compound_cache import CompoundCache, normalize_query
+from shared_cache import open_store
+from singleflight import SingleFlight
+
+# RDKit, pandas, py3Dmol, psycopg2 and the modules built on them are imported
+# inside the code paths that need them, timed with startup.phase, so a cold
+# replica can paint its first page without importing them.
 
 # Page configuration
 st.set_page_config(
@@ -216,182 +217,203 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Database connection
+# Database connection pool
 @st.cache_resource
-def get_db_connection():
+def get_db_pool():
     try:
         db_url = os.getenv("DB_URL")
         if db_url:
-            conn = psycopg2.connect(db_url)
-            return conn
+            with startup.phase("import db"):
+                from db import ConnectionPool
+            return ConnectionPool.from_env()
         else:
             return None
     except Exception as e:
         st.error(f"Database connection error: {e}")
         return None
 
+# Create or migrate the history schema once per process; a failure is not
+# cached, so the next run retries it
+@st.cache_resource
+def ensure_schema(_pool):
+    from db import ensure_history_schema
+    with startup.phase("init_db"):
+        ensure_history_schema(_pool)
+    return True
+
 # Initialize database
 def init_db():
-    conn = get_db_connection()
-    if conn:
+    pool = get_db_pool()
+    if pool:
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS molecule_history (
-                        id SERIAL PRIMARY KEY,
-                        compound_name VARCHAR(255),
-                        cid INTEGER,
-                        formula VARCHAR(100),
-                        molecular_weight FLOAT,
-                        smiles TEXT,
-                        inchi TEXT,
-                        logp FLOAT,
-                        tpsa FLOAT,
-                        searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                conn.commit()
+            ensure_schema(pool)
         except Exception as e:
             st.error(f"Database initialization error: {e}")
 
-# Get molecule from PubChem using pubchempy
-@st.cache_data(ttl=3600)
+# Persistent compound cache shared across restarts and replicas
+@st.cache_resource
+def get_compound_cache():
+    try:
+        return CompoundCache.from_env()
+    except Exception:
+        return None
+
+# Local synonym-to-CID index built from a PubChem dump; None until one is built
+@st.cache_resource
+def get_synonym_index():
+    try:
+        with startup.phase("import synonym_index"):
+            from synonym_index import SynonymIndex
+        with startup.phase("load synonym index"):
+            return SynonymIndex.load()
+    except Exception:
+        return None
+
+# In-flight lookups shared by concurrent sessions asking for the same thing
+@st.cache_resource
+def get_flights():
+    return SingleFlight()
+
+# Compressed in-process cache for records, SDF text, images and descriptors,
+# bounded by PAYLOAD_CACHE_MB and shared by every session. With SHARED_CACHE
+# set it reads through to a tier every replica shares.
+@st.cache_resource
+def get_payload_store():
+    return open_store(get_db_pool())
+
+# The UI-independent lookup pipeline, sharing this process's caches
+@st.cache_resource
+def get_service():
+    return core.MoleculeService(
+        get_compound_cache(), get_synonym_index(), get_payload_store(), get_flights()
+    )
+
+# Get molecule from PubChem using pubchempy, through the persistent cache,
+# the synonym index and the payload store
+@metrics.timed('get_molecule_data', cached=True)
 def get_molecule_data(name):
     try:
-        # Search for compounds
-        compounds = pcp.get_compounds(name, 'name')
-        
-        if not compounds:
-            return None
-        
-        compound = compounds[0]
-        
-        # Get properties
-        mol_data = {
-            'cid': compound.cid,
-            'formula': compound.molecular_formula,
-            'weight': compound.molecular_weight,
-            'iupac': compound.iupac_name if compound.iupac_name else 'N/A',
-            'smiles': compound.canonical_smiles if compound.canonical_smiles else 'N/A',
-            'inchi': compound.inchi if compound.inchi else 'N/A',
-            'inchikey': compound.inchikey if compound.inchikey else 'N/A',
-        }
-        
-        # Get additional properties if available
-        try:
-            mol_data['xlogp'] = compound.xlogp if compound.xlogp else 'N/A'
-            mol_data['tpsa'] = compound.tpsa if compound.tpsa else 'N/A'
-            mol_data['complexity'] = compound.complexity if compound.complexity else 'N/A'
-            mol_data['h_bond_donor'] = compound.h_bond_donor_count if compound.h_bond_donor_count else 'N/A'
-            mol_data['h_bond_acceptor'] = compound.h_bond_acceptor_count if compound.h_bond_acceptor_count else 'N/A'
-            mol_data['rotatable_bonds'] = compound.rotatable_bond_count if compound.rotatable_bond_count else 'N/A'
-        except:
-            pass
-        
-        # Get 3D SDF
-        try:
-            sdf_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{compound.cid}/SDF?record_type=3d"
-            sdf_response = requests.get(sdf_url, timeout=10)
-            if sdf_response.status_code == 200:
-                mol_data['sdf'] = sdf_response.text
-            else:
-                mol_data['sdf'] = None
-        except:
-            mol_data['sdf'] = None
-        
-        return mol_data
-        
+        return get_service().lookup(name)
     except Exception as e:
         st.error(f"Error fetching molecule data: {e}")
         return None
 
 # Get RDKit molecule from SMILES
-@st.cache_data
+@metrics.timed('get_rdkit_mol', cached=True)
+@st.cache_data(max_entries=1000)
 def get_rdkit_mol(smiles):
-    try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol:
-            return mol
-        return None
-    except:
-        return None
+    metrics.cache_miss()
+    return core.parse_smiles(smiles)
 
-# Calculate molecular descriptors using RDKit
-def calculate_descriptors(mol):
-    if not mol:
-        return {}
-    
+# Calculate molecular descriptors using RDKit, memoized by SMILES so a
+# compound is described once whichever tab, session or replica asks
+@metrics.timed('calculate_descriptors', cached=True)
+@st.cache_data(max_entries=5000)
+def calculate_descriptors(smiles):
+    metrics.cache_miss()
     try:
-        descriptors = {
-            'LogP': round(Descriptors.MolLogP(mol), 2),
-            'TPSA': round(Descriptors.TPSA(mol), 2),
-            'Mol Weight': round(Descriptors.MolWt(mol), 2),
-            'Num H Donors': Descriptors.NumHDonors(mol),
-            'Num H Acceptors': Descriptors.NumHAcceptors(mol),
-            'Num Rotatable Bonds': Descriptors.NumRotatableBonds(mol),
-            'Num Aromatic Rings': Descriptors.NumAromaticRings(mol),
-            'Num Aliphatic Rings': Descriptors.NumAliphaticRings(mol),
-        }
-        return descriptors
+        return get_service().describe(smiles)
     except Exception as e:
         st.error(f"Error calculating descriptors: {e}")
         return {}
 
-# Get molecule images from PubChem
-@st.cache_data(ttl=3600)
-def get_molecule_images(cid):
+# Extended property profile of one compound: the selected descriptors plus
+# drug-likeness rule checks and fingerprints, computed once per selection
+@metrics.timed('get_property_profile', cached=True)
+@st.cache_data(max_entries=2000)
+def get_property_profile(smiles, names):
+    metrics.cache_miss()
+    return core.property_profile(smiles, list(names))
+
+# Canonical SMILES of a Ketcher drawing, memoized by its Mol block so
+# reruns with an unchanged drawing skip parsing entirely
+@metrics.timed('parse_drawing', cached=True)
+@st.cache_data(max_entries=500)
+def get_drawing_smiles(molblock):
+    metrics.cache_miss()
+    return core.drawing_smiles(molblock)
+
+# Each picture panel asks only for its own image, when it is opened. The
+# encoded PNG bytes are cached, displayed and downloaded as they are; a
+# smaller size gives a thumbnail.
+@metrics.timed('get_molecule_image', cached=True)
+def get_molecule_image(cid, kind='2d', smiles=None, sdf=None, size=None):
+    return get_service().image(cid, kind, smiles, sdf, size)
+
+# Render a drawn or parsed molecule locally
+def get_depiction(mol, fmt='png'):
     try:
-        # 2D Structure Image
-        image_2d_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/PNG?image_size=large"
-        response_2d = requests.get(image_2d_url, timeout=10)
-        img_2d = Image.open(BytesIO(response_2d.content))
-        
-        # 3D Conformer Image
-        image_3d_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/PNG?image_size=large&image_type=3d"
-        response_3d = requests.get(image_3d_url, timeout=10)
-        img_3d = Image.open(BytesIO(response_3d.content))
-        
-        return img_2d, img_3d
-    except Exception as e:
-        return None, None
+        with startup.phase("import depiction"):
+            import depiction
+        return depiction.render_molecule(mol, fmt=fmt)
+    except Exception:
+        return None
+
+# Fingerprint index over every searched and imported compound
+@st.cache_resource
+def get_similarity_index():
+    with startup.phase("import similarity"):
+        from similarity import FingerprintIndex
+    with startup.phase("load similarity index"):
+        return FingerprintIndex.load()
+
+# Background feeder that fingerprints new and not yet indexed history compounds
+@st.cache_resource
+def get_similarity_feeder():
+    with startup.phase("import similarity"):
+        from similarity import IndexFeeder
+    pool = get_db_pool()
+    backfill = None
+    if pool:
+        from db import iter_history_compounds
+        backfill = lambda after_id: iter_history_compounds(pool, after_id)
+    return IndexFeeder(get_similarity_index(), backfill=backfill)
+
+# Background writer that batches history inserts off the request path
+@st.cache_resource
+def get_history_writer():
+    pool = get_db_pool()
+    if not pool:
+        return None
+    with startup.phase("import history_writer"):
+        from history_writer import HistoryWriter
+    return HistoryWriter(pool)
 
 # Save to database
+@metrics.timed('save_to_db')
 def save_to_db(name, data):
-    conn = get_db_connection()
-    if conn and data:
+    if not data:
+        return
+    get_similarity_feeder().submit(data['smiles'], name, data['cid'])
+    
+    writer = get_history_writer()
+    if writer:
+        if 'session_id' not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex
+        writer.record(st.session_state.session_id, name, data)
+
+# Get search history; a short TTL keeps every rerun of every session off the DB
+@metrics.timed('get_history', cached=True)
+@st.cache_data(ttl=10)
+def get_history(limit=10):
+    metrics.cache_miss()
+    pool = get_db_pool()
+    if pool:
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO molecule_history 
-                    (compound_name, cid, formula, molecular_weight, smiles, inchi, logp, tpsa)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    name, 
-                    data['cid'], 
-                    data['formula'], 
-                    data['weight'], 
-                    data['smiles'],
-                    data.get('inchi', None),
-                    data.get('xlogp', None),
-                    data.get('tpsa', None)
-                ))
-                conn.commit()
+            from db import recent_history
+            return recent_history(pool, limit)
         except Exception as e:
-            st.error(f"Error saving to database: {e}")
+            return []
+    return []
 
-# Get search history
-def get_history():
-    conn = get_db_connection()
-    if conn:
+# Get the most searched compounds
+@st.cache_data(ttl=60)
+def get_popular(limit=5):
+    pool = get_db_pool()
+    if pool:
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT compound_name, formula, molecular_weight, searched_at
-                    FROM molecule_history
-                    ORDER BY searched_at DESC
-                    LIMIT 10
-                """)
-                return cur.fetchall()
+            from db import popular_compounds
+            return popular_compounds(pool, limit)
         except Exception as e:
             return []
     return []
@@ -399,6 +421,8 @@ def get_history():
 # Visualize molecule with py3Dmol
 def visualize_molecule(sdf_data, style='stick'):
     try:
+        with startup.phase("import py3Dmol"):
+            import py3Dmol
         view = py3Dmol.view(width=800, height=600)
         view.addModel(sdf_data, 'sdf')
         
@@ -418,9 +442,360 @@ def visualize_molecule(sdf_data, style='stick'):
         st.error(f"Error creating 3D visualization: {e}")
         return None
 
+# Use the PubChem 3D record when there is one, otherwise a locally generated
+# conformer. Returns None while local generation is still running.
+def get_3d_structure(sdf, smiles):
+    if sdf:
+        return sdf
+    try:
+        with startup.phase("import conformers"):
+            import conformers
+        return conformers.request_conformer(smiles)
+    except Exception:
+        return None
+
+# Whether a local conformer for a SMILES is still being generated
+def conformer_pending(smiles):
+    try:
+        import conformers
+        return conformers.conformer_status(smiles) == 'pending'
+    except Exception:
+        return False
+
+# Wait for a background conformer without blocking the rest of the page
+@st.fragment(run_every=1)
+def await_conformer(smiles):
+    import conformers
+    if conformers.conformer_status(smiles) != 'pending':
+        st.rerun()
+    st.info("⏳ Generating a 3D conformer locally...")
+
+# Interactive 3D panel shared by the search and draw tabs. As a fragment,
+# changing the style reruns only this panel, not the whole search.
+@st.fragment
+def show_3d_panel(sdf, smiles, file_name):
+    style = st.selectbox(
+        "3D Style",
+        ["stick", "sphere", "ball_stick"],
+        key=f"style_{file_name}",
+        help="Choose how the molecule is displayed in 3D"
+    )
+    
+    structure = get_3d_structure(sdf, smiles)
+    if structure:
+        view = visualize_molecule(structure, style)
+        if view:
+            with startup.phase("import stmol"):
+                from stmol import showmol
+            showmol(view, height=600, width=800)
+            if not sdf:
+                st.caption("Conformer generated locally with RDKit (ETKDG + MMFF)")
+            st.download_button(
+                label="📥 Download SDF File",
+                data=structure,
+                file_name=file_name,
+                mime="chemical/x-mdl-sdfile",
+                on_click="ignore"
+            )
+    elif smiles and conformer_pending(smiles):
+        await_conformer(smiles)
+    else:
+        st.warning("3D structure not available for this molecule")
+
+# One picture panel of a search result
+def show_picture_panel(data, search_query, kind):
+    label = "2D Structure" if kind == '2d' else "3D Picture"
+    st.subheader(f"{label}: {search_query.title()}")
+    
+    png = get_molecule_image(data['cid'], kind, data['smiles'], data.get('sdf'))
+    if png:
+        st.image(png, use_container_width=True)
+        st.download_button(
+            label=f"📥 Download {label}",
+            data=png,
+            file_name=f"{search_query}_{kind.upper()}.png",
+            mime="image/png",
+            on_click="ignore"
+        )
+    elif kind == '3d':
+        st.warning("3D image not available for this molecule")
+
+# Visualizations of a search result. Only the selected view is built, so its
+# images and 3D model are fetched on demand, and switching views reruns
+# this fragment alone instead of the whole search.
+@st.fragment
+def show_visualizations(data, search_query):
+    views = ["📐 2D Structure", "🔮 3D Picture", "🌐 Interactive 3D"]
+    view = st.segmented_control("View", views, default=views[0], key="search_view",
+                                label_visibility="collapsed")
+    
+    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+    if view == views[1]:
+        show_picture_panel(data, search_query, '3d')
+    elif view == views[2]:
+        st.subheader(f"Interactive 3D: {search_query.title()}")
+        show_3d_panel(data.get('sdf'), data['smiles'], f"{search_query}.sdf")
+    else:
+        show_picture_panel(data, search_query, '2d')
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# Peak resident memory of this process
+def peak_rss_mb():
+    try:
+        import resource
+        # ru_maxrss is in KiB on Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except Exception:
+        return 'N/A'
+
+# Prometheus endpoint, started once per process when METRICS_PORT is set
+@st.cache_resource
+def start_metrics_server():
+    try:
+        return metrics.start_http_server()
+    except Exception:
+        return None
+
+# Warm the persistent caches for Quick Access and popular compounds once per
+# process, in the background so the first page is not held up by it
+@st.cache_resource
+def start_warmup():
+    if os.getenv("WARMUP_ON_START", "1") == "0":
+        return None
+    pool = get_db_pool()
+    # The service this process serves searches from, so warm-up fills its payload store too
+    service = get_service()
+    
+    def warm():
+        try:
+            with startup.phase("import warmup"):
+                import warmup
+            with startup.phase("cache warmup"):
+                warmup.run(warmup.warmup_queries(pool), service)
+        except Exception:
+            pass
+    
+    thread = threading.Thread(target=warm, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
+
+# Extended property panel shared by the search and draw tabs. Nothing is
+# computed until it is switched on, and as a fragment, changing the
+# selection reruns only this panel.
+@st.fragment
+def show_profile_panel(smiles, file_stem):
+    if not st.toggle("🧬 Extended property profile", key=f"profile_{file_stem}",
+                     help="QED, Lipinski/Veber checks, fingerprints and any RDKit descriptor"):
+        return
+    
+    with startup.phase("import descriptor_engine"):
+        import descriptor_engine as engine
+    with startup.phase("import pandas"):
+        import pandas as pd
+    preset = st.selectbox(
+        "Descriptor set",
+        list(engine.DESCRIPTOR_SETS) + ["custom"],
+        index=1,
+        key=f"profile_set_{file_stem}"
+    )
+    if preset == "custom":
+        names = st.multiselect("Descriptors", engine.DESCRIPTOR_SETS['all'],
+                               default=engine.DESCRIPTOR_SETS['drug-likeness'],
+                               key=f"profile_names_{file_stem}")
+    else:
+        names = engine.DESCRIPTOR_SETS[preset]
+    
+    profile = get_property_profile(smiles, tuple(names))
+    if not profile:
+        st.warning("Could not compute a profile for this structure")
+        return
+    
+    col_a, col_b = st.columns(2)
+    with col_a:
+        table = pd.DataFrame(list(profile['descriptors'].items()), columns=['property', 'value'])
+        st.dataframe(table, hide_index=True, use_container_width=True)
+    with col_b:
+        rules = pd.DataFrame(profile['rules'])
+        rules['pass'] = rules['pass'].map({True: "✅", False: "❌"})
+        st.dataframe(rules, hide_index=True, use_container_width=True)
+        for label, (on_bits, bits) in profile['fingerprints'].items():
+            st.caption(f"{label} • {on_bits} bits set")
+            st.code(bits, language=None)
+    
+    export = pd.concat([
+        table,
+        pd.DataFrame([(f"{r['rule']} {r['property']} <= {r['limit']}", r['pass']) for r in profile['rules']],
+                     columns=['property', 'value']),
+        pd.DataFrame([(label, bits) for label, (_, bits) in profile['fingerprints'].items()],
+                     columns=['property', 'value']),
+    ], ignore_index=True)
+    st.download_button(
+        label="📥 Download Profile (CSV)",
+        data=export.to_csv(index=False),
+        file_name=f"{file_stem}_profile.csv",
+        mime="text/csv",
+        key=f"profile_csv_{file_stem}",
+        on_click="ignore"
+    )
+
+# Draw tab. As a fragment, each Ketcher edit reruns only this tab; Streamlit
+# stops a run that is superseded by a newer edit, so rapid edits end with
+# just the latest structure analyzed.
+@st.fragment
+def show_draw_tab():
+    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+    st.subheader("✏️ Draw Your Own Molecule")
+    st.markdown("*Use the Ketcher editor below to draw custom molecular structures*")
+    
+    # Ketcher molecule editor; the rest of the tab expects a Mol block
+    with startup.phase("import streamlit_ketcher"):
+        from streamlit_ketcher import st_ketcher
+    molecule_data = st_ketcher(molecule_format='MOLFILE', key="ketcher")
+    
+    if molecule_data:
+        st.success("✅ Molecule drawn successfully!")
+        
+        # Try to convert to RDKit mol
+        try:
+            smiles = get_drawing_smiles(molecule_data)
+            mol = get_rdkit_mol(smiles) if smiles else None
+            if mol:
+                structure_png = get_depiction(mol)
+                if structure_png:
+                    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                    st.subheader("📐 2D Structure")
+                    st.image(structure_png, width=400)
+                    st.download_button(
+                        label="📥 Download 2D Structure",
+                        data=structure_png,
+                        file_name="custom_molecule_2D.png",
+                        mime="image/png",
+                        key="custom_png"
+                    )
+                    st.markdown('</div>', unsafe_allow_html=True)
+                
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                    st.subheader("📊 Calculated Properties")
+                    descriptors = calculate_descriptors(smiles)
+                    
+                    for key, value in descriptors.items():
+                        st.metric(key, value)
+                    
+                    st.markdown('</div>', unsafe_allow_html=True)
+                
+                with col2:
+                    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                    st.subheader("🧪 Generated SMILES")
+                    st.code(smiles, language=None)
+                    st.download_button(
+                        label="📋 Download SMILES",
+                        data=smiles,
+                        file_name="custom_molecule_smiles.txt",
+                        mime="text/plain",
+                        key="custom_smiles"
+                    )
+                    st.markdown('</div>', unsafe_allow_html=True)
+                
+                st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                show_profile_panel(smiles, "custom_molecule")
+                st.markdown('</div>', unsafe_allow_html=True)
+                
+                st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                st.subheader("🌐 Interactive 3D")
+                show_3d_panel(None, smiles, "custom_molecule.sdf")
+                st.markdown('</div>', unsafe_allow_html=True)
+        except:
+            st.warning("Could not analyze the drawn structure")
+        
+        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+        with st.expander("📄 Molecule Data (MOL format)", expanded=False):
+            st.code(molecule_data, language=None)
+            st.download_button(
+                label="📥 Download MOL File",
+                data=molecule_data,
+                file_name="custom_molecule.mol",
+                mime="chemical/x-mdl-molfile"
+            )
+        st.markdown('</div>', unsafe_allow_html=True)
+    else:
+        st.info("💡 **Tip:** Draw a molecule above to see its properties and generate SMILES notation!")
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# Largest export offered for download in the browser; bigger ones stay on
+# disk for the CLI or a file copy
+EXPORT_DOWNLOAD_MB = float(os.getenv("EXPORT_DOWNLOAD_MB", 200))
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+# Bulk export of history or the compound cache. Rows stream from the source
+# to a file in EXPORT_DIR a chunk at a time; as a fragment, the form reruns
+# on its own.
+@st.fragment
+def show_export_tab():
+    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+    st.subheader("📤 Export")
+    st.markdown("*Write the search history or the compound cache to CSV, SDF or Parquet*")
+    
+    sources = {"Search history": "history", "Compound cache": "compounds"}
+    source = sources[st.selectbox("Source", list(sources), key="export_source")]
+    fmt = st.radio("Format", export.FORMATS, horizontal=True, format_func=str.upper, key="export_format")
+    descriptor_set = st.selectbox(
+        "Descriptor columns",
+        ["none", *export.DESCRIPTOR_SETS],
+        key="export_descriptors",
+        help="Computed with RDKit from each row's SMILES while the file is written"
+    )
+    
+    if st.button("📤 Export", key="export_run"):
+        pool = get_db_pool()
+        if source == "history" and pool is None:
+            st.error("❌ Search history needs a database (DB_URL)")
+        else:
+            path = export.export_path(source, fmt)
+            status = st.empty()
+            try:
+                count = export.export(
+                    source, fmt, path,
+                    descriptors=None if descriptor_set == "none" else descriptor_set,
+                    pool=pool,
+                    cache=get_compound_cache(),
+                    progress=lambda rows: status.caption(f"{rows} rows written...")
+                )
+                st.session_state.export_file = (path, count)
+            except Exception as e:
+                st.error(f"Export failed: {e}")
+            status.empty()
+    
+    if 'export_file' in st.session_state:
+        path, count = st.session_state.export_file
+        size_mb = os.path.getsize(path) / 1024 / 1024 if os.path.exists(path) else 0
+        st.success(f"✅ Exported {count} rows to `{path}` ({size_mb:.1f} MB)")
+        if size_mb <= EXPORT_DOWNLOAD_MB:
+            st.download_button(
+                label="📥 Download Export",
+                # Read only when clicked
+                data=lambda: read_file(path),
+                file_name=os.path.basename(path),
+                on_click="ignore",
+                key="export_download"
+            )
+        else:
+            st.info(f"💡 Larger than {EXPORT_DOWNLOAD_MB:.0f} MB; copy the file from the server, "
+                    f"or run `python export.py {source} --format {fmt}` next to the data")
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
 # Main app
 def main():
     init_db()
+    start_metrics_server()
+    start_warmup()
     
     # Header with animation
     st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
@@ -430,32 +805,72 @@ def main():
     
     # Sidebar
     with st.sidebar:
-        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-        st.header("⚙️ Visualization Settings")
-        
-        style = st.selectbox(
-            "3D Style",
-            ["stick", "sphere", "ball_stick"],
-            help="Choose how the molecule is displayed in 3D"
-        )
-        
-        st.markdown('</div>', unsafe_allow_html=True)
-        
         st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
         st.header("📊 Recent Searches")
         history = get_history()
         if history:
             for item in history:
-                if st.button(f"🔄 {item['compound_name']}", key=f"hist_{item['compound_name']}"):
+                if st.button(f"🔄 {item['compound_name']}", key=f"hist_{item['query_key']}_{item['cid']}"):
                     st.session_state.search_query = item['compound_name']
                 st.caption(f"{item['formula']} • {item['searched_at'].strftime('%Y-%m-%d %H:%M')}")
                 st.divider()
         else:
             st.info("No search history yet")
         st.markdown('</div>', unsafe_allow_html=True)
+        
+        if st.toggle("🩺 Diagnostics", help="Per-stage latency of the search pipeline"):
+            st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+            stage_rows = metrics.summary()
+            with startup.phase("import pandas"):
+                import pandas as pd
+            if stage_rows:
+                st.dataframe(pd.DataFrame(stage_rows), hide_index=True, use_container_width=True)
+            else:
+                st.caption("No timings recorded yet")
+            if "pubchem" in sys.modules:
+                pubchem = sys.modules["pubchem"]
+                st.caption(f"PubChem circuit: {pubchem.breaker.state} • {pubchem.breaker.failures} consecutive failures "
+                           f"• {pubchem.flights.coalesced} requests coalesced")
+            st.caption(f"Lookups coalesced across sessions: {get_flights().coalesced}")
+            store_stats = get_payload_store().stats()
+            payload_stats = store_stats.get('local', store_stats)
+            st.caption(
+                f"Payload cache: {payload_stats['entries']} entries, {payload_stats['stored_mb']} MB stored "
+                f"({payload_stats['uncompressed_mb']} MB uncompressed) of a {payload_stats['budget_mb']} MB budget, "
+                f"{payload_stats['hits']} hits, {payload_stats['misses']} misses, "
+                f"{payload_stats['evictions']} evicted • peak RSS {peak_rss_mb()} MB"
+            )
+            if 'shared' in store_stats:
+                shared_stats = store_stats['shared']
+                st.caption(
+                    f"Shared cache ({shared_stats['backend']}): {shared_stats['hits']} hits, "
+                    f"{shared_stats['misses']} misses, {shared_stats['errors']} errors • "
+                    f"overall hit ratio {store_stats['hit_ratio']}"
+                )
+            elif payload_stats.get('shared_error'):
+                st.warning(f"Shared cache unavailable, caching in-process only ({payload_stats['shared_error']})")
+            st.caption("Startup cost of this process")
+            st.dataframe(pd.DataFrame(startup.report()), hide_index=True, use_container_width=True)
+            st.download_button(
+                label="📥 Export Metrics (Prometheus)",
+                data=metrics.render_prometheus(),
+                file_name="chemvis_metrics.prom",
+                mime="text/plain"
+            )
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        popular = get_popular()
+        if popular:
+            st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+            st.header("🔥 Popular Compounds")
+            for item in popular:
+                if st.button(f"⭐ {item['compound_name']}", key=f"pop_{item['query_key']}_{item['cid']}"):
+                    st.session_state.search_query = item['compound_name']
+                st.caption(f"{item['formula']} • {item['hit_count']} searches")
+            st.markdown('</div>', unsafe_allow_html=True)
     
     # Main content - Tabs for different modes
-    tab1, tab2 = st.tabs(["🔍 Search Molecules", "✏️ Draw Molecule"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["🔍 Search Molecules", "✏️ Draw Molecule", "📦 Batch Lookup", "🧭 Similarity Search", "📤 Export"])
     
     with tab1:
         # Simple text input for search
@@ -471,6 +886,21 @@ def main():
             help="Type the name of any molecule to search PubChem"
         )
         
+        # Completions from the local synonym index
+        synonyms = get_synonym_index() if search_query else None
+        if synonyms:
+            typed = normalize_query(search_query)
+            suggestions = [
+                item for item in synonyms.complete(search_query, limit=6)
+                if normalize_query(item['name']) != typed
+            ]
+            if suggestions:
+                st.caption("Did you mean:")
+                for col, item in zip(st.columns(len(suggestions)), suggestions):
+                    with col:
+                        if st.button(item['name'], key=f"suggest_{item['cid']}"):
+                            search_query = item['name']
+        
         # Popular molecules quick access
         st.markdown("**Quick Access:**")
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -494,207 +924,228 @@ def main():
         
         if search_query:
             with st.spinner("🔬 Analyzing molecular structure..."):
-                time.sleep(0.3)
                 data = get_molecule_data(search_query)
+            
+            if data:
+                save_to_db(search_query, data)
+                
+                if data.get('fetch_errors'):
+                    st.warning(f"⚠️ Some resources could not be loaded: {', '.join(data['fetch_errors'])}")
+                if data.get('stale'):
+                    st.info("🕰️ Showing the last known record while a fresh copy is fetched from PubChem")
+                
+                # Get RDKit molecule for additional analysis
+                rdkit_mol = get_rdkit_mol(data['smiles']) if data['smiles'] != 'N/A' else None
                 
-                if data:
-                    save_to_db(search_query, data)
+                # Create layout; properties are filled in first so they show
+                # while the visualization panel is still loading its assets
+                col1, col2 = st.columns([2, 1])
+                
+                with col2:
+                    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                    st.subheader("📋 Basic Properties")
                     
-                    # Get RDKit molecule for additional analysis
-                    rdkit_mol = get_rdkit_mol(data['smiles']) if data['smiles'] != 'N/A' else None
+                    st.metric("PubChem CID", f"{data['cid']}")
+                    st.metric("Molecular Formula", data['formula'])
+                    st.metric("Molecular Weight", f"{data['weight']:.2f} g/mol")
                     
-                    # Create layout
-                    col1, col2 = st.columns([2, 1])
+                    st.markdown('</div>', unsafe_allow_html=True)
                     
-                    with col1:
-                        # Nested tabs for different visualizations
-                        viz_tab1, viz_tab2, viz_tab3 = st.tabs(["📐 2D Structure", "🔮 3D Picture", "🌐 Interactive 3D"])
-                        
-                        with viz_tab1:
-                            st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                            st.subheader(f"2D Structure: {search_query.title()}")
-                            
-                            img_2d, _ = get_molecule_images(data['cid'])
-                            if img_2d:
-                                st.image(img_2d, use_container_width=True)
-                                buf = BytesIO()
-                                img_2d.save(buf, format='PNG')
-                                st.download_button(
-                                    label="📥 Download 2D Structure",
-                                    data=buf.getvalue(),
-                                    file_name=f"{search_query}_2D.png",
-                                    mime="image/png"
-                                )
-                            
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        with viz_tab2:
-                            st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                            st.subheader(f"3D Picture: {search_query.title()}")
-                            _, img_3d = get_molecule_images(data['cid'])
-                            if img_3d:
-                                st.image(img_3d, use_container_width=True)
-                                buf = BytesIO()
-                                img_3d.save(buf, format='PNG')
-                                st.download_button(
-                                    label="📥 Download 3D Picture",
-                                    data=buf.getvalue(),
-                                    file_name=f"{search_query}_3D.png",
-                                    mime="image/png"
-                                )
-                            else:
-                                st.warning("3D image not available for this molecule")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        with viz_tab3:
-                            st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                            st.subheader(f"Interactive 3D: {search_query.title()}")
-                            
-                            if data.get('sdf'):
-                                view = visualize_molecule(data['sdf'], style)
-                                if view:
-                                    showmol(view, height=600, width=800)
-                                    st.download_button(
-                                        label="📥 Download SDF File",
-                                        data=data['sdf'],
-                                        file_name=f"{search_query}.sdf",
-                                        mime="chemical/x-mdl-sdfile"
-                                    )
-                            else:
-                                st.warning("3D structure not available for this molecule")
-                            
-                            st.markdown('</div>', unsafe_allow_html=True)
+                    # Display molecular descriptors
+                    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                    st.subheader("🔬 Molecular Descriptors")
                     
-                    with col2:
-                        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                        st.subheader("📋 Basic Properties")
-                        
-                        st.metric("PubChem CID", f"{data['cid']}")
-                        st.metric("Molecular Formula", data['formula'])
-                        st.metric("Molecular Weight", f"{data['weight']:.2f} g/mol")
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        # Display molecular descriptors
-                        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                        st.subheader("🔬 Molecular Descriptors")
-                        
-                        # Use RDKit descriptors if available
-                        if rdkit_mol:
-                            rdkit_descriptors = calculate_descriptors(rdkit_mol)
-                            
-                            col_a, col_b = st.columns(2)
-                            with col_a:
-                                st.metric("LogP", rdkit_descriptors.get('LogP', 'N/A'))
-                                st.metric("H Donors", rdkit_descriptors.get('Num H Donors', 'N/A'))
-                                st.metric("Aromatic Rings", rdkit_descriptors.get('Num Aromatic Rings', 'N/A'))
-                            
-                            with col_b:
-                                st.metric("TPSA", f"{rdkit_descriptors.get('TPSA', 'N/A')} Ų")
-                                st.metric("H Acceptors", rdkit_descriptors.get('Num H Acceptors', 'N/A'))
-                                st.metric("Rotatable Bonds", rdkit_descriptors.get('Num Rotatable Bonds', 'N/A'))
-                        else:
-                            # Fallback to PubChem properties
-                            col_a, col_b = st.columns(2)
-                            with col_a:
-                                st.metric("XLogP", data.get('xlogp', 'N/A'))
-                                st.metric("H Donors", data.get('h_bond_donor', 'N/A'))
-                                st.metric("Complexity", data.get('complexity', 'N/A'))
-                            
-                            with col_b:
-                                st.metric("TPSA", f"{data.get('tpsa', 'N/A')}" + (" Ų" if data.get('tpsa') != 'N/A' else ""))
-                                st.metric("H Acceptors", data.get('h_bond_acceptor', 'N/A'))
-                                st.metric("Rotatable Bonds", data.get('rotatable_bonds', 'N/A'))
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
+                    # Use RDKit descriptors if available
+                    if rdkit_mol:
+                        rdkit_descriptors = calculate_descriptors(data['smiles'])
                         
-                        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                        st.subheader("🧪 Chemical Identifiers")
+                        col_a, col_b = st.columns(2)
+                        with col_a:
+                            st.metric("LogP", rdkit_descriptors.get('LogP', 'N/A'))
+                            st.metric("H Donors", rdkit_descriptors.get('Num H Donors', 'N/A'))
+                            st.metric("Aromatic Rings", rdkit_descriptors.get('Num Aromatic Rings', 'N/A'))
                         
-                        with st.expander("🔬 IUPAC Name", expanded=False):
-                            st.code(data['iupac'], language=None)
+                        with col_b:
+                            st.metric("TPSA", f"{rdkit_descriptors.get('TPSA', 'N/A')} Ų")
+                            st.metric("H Acceptors", rdkit_descriptors.get('Num H Acceptors', 'N/A'))
+                            st.metric("Rotatable Bonds", rdkit_descriptors.get('Num Rotatable Bonds', 'N/A'))
+                    else:
+                        # Fallback to PubChem properties
+                        col_a, col_b = st.columns(2)
+                        with col_a:
+                            st.metric("XLogP", data.get('xlogp', 'N/A'))
+                            st.metric("H Donors", data.get('h_bond_donor', 'N/A'))
+                            st.metric("Complexity", data.get('complexity', 'N/A'))
                         
-                        with st.expander("🧪 SMILES", expanded=False):
-                            st.code(data['smiles'], language=None)
-                            st.download_button(
-                                label="📋 Download SMILES",
-                                data=data['smiles'],
-                                file_name=f"{search_query}_smiles.txt",
-                                mime="text/plain",
-                                key="smiles_download"
-                            )
-                        
-                        with st.expander("🔑 InChI", expanded=False):
-                            st.code(data.get('inchi', 'N/A'), language=None)
-                        
-                        with st.expander("🔐 InChIKey", expanded=False):
-                            st.code(data.get('inchikey', 'N/A'), language=None)
-                        
-                        st.markdown(f"[🔗 View on PubChem](https://pubchem.ncbi.nlm.nih.gov/compound/{data['cid']})")
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
-                else:
-                    st.error(f"❌ Could not find molecule: {search_query}")
-                    st.info("💡 Try searching with a different name or chemical formula")
-    
-    with tab2:
-        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-        st.subheader("✏️ Draw Your Own Molecule")
-        st.markdown("*Use the Ketcher editor below to draw custom molecular structures*")
-        
-        # Ketcher molecule editor
-        molecule_data = st_ketcher()
-        
-        if molecule_data:
-            st.success("✅ Molecule drawn successfully!")
-            
-            # Try to convert to RDKit mol
-            try:
-                mol = Chem.MolFromMolBlock(molecule_data)
-                if mol:
-                    smiles = Chem.MolToSmiles(mol)
+                        with col_b:
+                            st.metric("TPSA", f"{data.get('tpsa', 'N/A')}" + (" Ų" if data.get('tpsa') != 'N/A' else ""))
+                            st.metric("H Acceptors", data.get('h_bond_acceptor', 'N/A'))
+                            st.metric("Rotatable Bonds", data.get('rotatable_bonds', 'N/A'))
                     
-                    col1, col2 = st.columns(2)
+                    st.markdown('</div>', unsafe_allow_html=True)
                     
-                    with col1:
-                        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                        st.subheader("📊 Calculated Properties")
-                        descriptors = calculate_descriptors(mol)
-                        
-                        for key, value in descriptors.items():
-                            st.metric(key, value)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
+                    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                    st.subheader("🧪 Chemical Identifiers")
                     
-                    with col2:
-                        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-                        st.subheader("🧪 Generated SMILES")
-                        st.code(smiles, language=None)
+                    with st.expander("🔬 IUPAC Name", expanded=False):
+                        st.code(data['iupac'], language=None)
+                    
+                    with st.expander("🧪 SMILES", expanded=False):
+                        st.code(data['smiles'], language=None)
                         st.download_button(
                             label="📋 Download SMILES",
-                            data=smiles,
-                            file_name="custom_molecule_smiles.txt",
+                            data=data['smiles'],
+                            file_name=f"{search_query}_smiles.txt",
                             mime="text/plain",
-                            key="custom_smiles"
+                            key="smiles_download",
+                            on_click="ignore"
                         )
-                        st.markdown('</div>', unsafe_allow_html=True)
-            except:
-                st.warning("Could not analyze the drawn structure")
+                    
+                    with st.expander("🔑 InChI", expanded=False):
+                        st.code(data.get('inchi', 'N/A'), language=None)
+                    
+                    with st.expander("🔐 InChIKey", expanded=False):
+                        st.code(data.get('inchikey', 'N/A'), language=None)
+                    
+                    st.markdown(f"[🔗 View on PubChem](https://pubchem.ncbi.nlm.nih.gov/compound/{data['cid']})")
+                    
+                    st.markdown('</div>', unsafe_allow_html=True)
+                
+                with col1:
+                    show_visualizations(data, search_query)
+                
+                if rdkit_mol:
+                    st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+                    show_profile_panel(data['smiles'], search_query)
+                    st.markdown('</div>', unsafe_allow_html=True)
+            else:
+                st.error(f"❌ Could not find molecule: {search_query}")
+                st.info("💡 Try searching with a different name or chemical formula")
+    
+    with tab2:
+        show_draw_tab()
+    
+    with tab3:
+        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+        st.subheader("📦 Batch Lookup")
+        st.markdown("*Resolve many names, CIDs or SMILES at once with PubChem's batched property tables*")
+        
+        uploaded = st.file_uploader("Upload a CSV or TXT file", type=["csv", "txt"])
+        pasted = st.text_area("...or paste identifiers, one per line", height=150)
+        kind = st.selectbox(
+            "Identifier type",
+            ["auto", "name", "cid", "smiles"],
+            help="Auto treats digits as CIDs and SMILES-looking strings as SMILES"
+        )
+        
+        lines = []
+        if uploaded is not None:
+            if uploaded.name.lower().endswith(".csv"):
+                with startup.phase("import pandas"):
+                    import pandas as pd
+                table = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+                column = st.selectbox("Identifier column", list(table.columns))
+                lines += table[column].tolist()
+            else:
+                lines += uploaded.getvalue().decode("utf-8", errors="replace").splitlines()
+        lines += pasted.splitlines()
+        with startup.phase("import batch_lookup"):
+            import batch_lookup
+        identifiers = batch_lookup.clean_identifiers(lines) if lines else []
+        st.caption(f"{len(identifiers)} unique identifiers")
+        
+        if identifiers and st.button("🚀 Resolve All"):
+            import pandas as pd
             
-            st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
-            with st.expander("📄 Molecule Data (MOL format)", expanded=False):
-                st.code(molecule_data, language=None)
+            # Re-running the same input resumes from its checkpoint
+            checkpoint = batch_lookup.BatchCheckpoint.for_input(identifiers, kind)
+            results = checkpoint.load()
+            progress = st.progress(min(len(results) / len(identifiers), 1.0))
+            table_slot = st.empty()
+            
+            for chunk in batch_lookup.iter_batch_lookup(identifiers, kind, checkpoint=checkpoint):
+                results = pd.concat([results, chunk], ignore_index=True)
+                progress.progress(
+                    min(len(results) / len(identifiers), 1.0),
+                    text=f"Resolved {len(results)} of {len(identifiers)}"
+                )
+                table_slot.dataframe(results, use_container_width=True)
+            
+            progress.empty()
+            table_slot.empty()
+            st.session_state.batch_results = results
+            
+            feeder = get_similarity_feeder()
+            resolved = results[results['smiles'] != 'N/A']
+            for smiles, name, cid in zip(resolved['smiles'], resolved['query'], resolved['cid']):
+                feeder.submit(smiles, name, cid)
+        
+        if 'batch_results' in st.session_state:
+            with startup.phase("import descriptor_engine"):
+                import descriptor_engine
+            results = st.session_state.batch_results
+            failed = int((results['error'] != '').sum())
+            st.success(f"✅ {len(results) - failed} resolved, {failed} failed")
+            st.dataframe(results, use_container_width=True)
+            st.download_button(
+                label="📥 Download Results (CSV)",
+                data=results.to_csv(index=False),
+                file_name="batch_lookup.csv",
+                mime="text/csv"
+            )
+            
+            descriptor_set = st.selectbox(
+                "Descriptor set",
+                list(descriptor_engine.DESCRIPTOR_SETS),
+                help="'all' computes every descriptor in RDKit's catalogue"
+            )
+            if st.button("🧮 Compute Descriptors"):
+                resolved = results[results['smiles'] != 'N/A']
+                with st.spinner(f"Computing descriptors for {len(resolved)} molecules..."):
+                    table = descriptor_engine.compute_descriptor_table(resolved['smiles'], descriptor_set)
+                table.insert(0, 'query', resolved['query'].to_numpy())
+                table.insert(1, 'cid', resolved['cid'].to_numpy())
+                st.session_state.batch_descriptors = table
+            
+            if 'batch_descriptors' in st.session_state:
+                st.dataframe(st.session_state.batch_descriptors, use_container_width=True)
                 st.download_button(
-                    label="📥 Download MOL File",
-                    data=molecule_data,
-                    file_name="custom_molecule.mol",
-                    mime="chemical/x-mdl-molfile"
+                    label="📥 Download Descriptors (CSV)",
+                    data=st.session_state.batch_descriptors.to_csv(index=False),
+                    file_name="batch_descriptors.csv",
+                    mime="text/csv"
                 )
-            st.markdown('</div>', unsafe_allow_html=True)
-        else:
-            st.info("💡 **Tip:** Draw a molecule above to see its properties and generate SMILES notation!")
         
         st.markdown('</div>', unsafe_allow_html=True)
+    
+    with tab4:
+        st.markdown('<div class="molecule-card">', unsafe_allow_html=True)
+        st.subheader("🧭 Similarity Search")
+        st.markdown("*Search the compounds searched or imported so far*")
+        
+        query = st.text_input("SMILES or SMARTS query", placeholder="e.g. c1ccccc1C(=O)O")
+        mode = st.radio("Mode", ["Similar compounds", "Contains substructure"], horizontal=True)
+        limit = st.slider("Maximum results", 5, 100, 20)
+        
+        if query:
+            # The index, and RDKit with it, loads on the first query
+            index = get_similarity_feeder().index
+            st.caption(f"{len(index)} compounds indexed")
+            if mode == "Similar compounds":
+                matches = index.search_similar(query, k=limit)
+            else:
+                matches = index.search_substructure(query, limit=limit)
+            
+            if matches:
+                import pandas as pd
+                st.dataframe(pd.DataFrame(matches), use_container_width=True)
+            else:
+                st.info("No matching compounds found")
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with tab5:
+        show_export_tab()
 
 if __name__ == "__main__":
     main()
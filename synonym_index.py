@@ -0,0 +1,256 @@
+import argparse
+import gzip
+import heapq
+import json
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import sys
+import tempfile
+from itertools import groupby
+
+import numpy as np
+
+from compound_cache import normalize_query
+
+SYNONYM_INDEX_DIR = os.getenv("SYNONYM_INDEX_DIR", os.path.join(".cache", "synonyms"))
+
+# Longer synonyms are mostly systematic names nobody types; skipping them
+# keeps the index small
+MAX_SYNONYM_LENGTH = 80
+
+# Prefix matches examined per completion before ranking by length
+COMPLETION_SCAN = 200
+
+# Synonyms sorted in memory at once while building. Each sorted chunk is
+# spilled to a temporary run file and the runs are merged, so building from
+# PubChem's full dump (over 100M rows) needs memory for one chunk only.
+BUILD_CHUNK_SIZE = 1_000_000
+
+# Elements copied at a time when turning a raw column into a .npy file
+_COPY_CHUNK = 1 << 20
+
+
+# Read a PubChem CID-Synonym dump ("CID<TAB>synonym" per line, optionally gzipped)
+def read_dump(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            cid, _, synonym = line.rstrip("\n").partition("\t")
+            if cid.isdigit() and synonym:
+                yield int(cid), synonym
+
+
+# Sort one chunk of (key, cid, synonym) records and write it to a run file
+def _spill(records, directory):
+    records.sort()
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".run", delete=False) as f:
+        for record in records:
+            pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+    return f.name
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+# (key, cid, synonym) records of the pairs in key order, merged from sorted
+# runs written to work_dir
+def _sorted_records(pairs, work_dir, max_length, chunk_size):
+    runs = []
+    chunk = []
+    for cid, synonym in pairs:
+        key = normalize_query(synonym)
+        if not key or len(key) > max_length:
+            continue
+        # Byte order, to match the comparisons made at lookup time
+        chunk.append((key.encode("utf-8"), cid, synonym.strip()))
+        if len(chunk) >= chunk_size:
+            runs.append(_spill(chunk, work_dir))
+            chunk = []
+    if chunk:
+        runs.append(_spill(chunk, work_dir))
+    return heapq.merge(*(_read_run(path) for path in runs))
+
+
+# A .npy file holding a column first written as raw values to raw_path
+def _write_array_from_raw(directory, name, raw_path, dtype):
+    tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+    count = os.path.getsize(raw_path) // np.dtype(dtype).itemsize
+    if count == 0:
+        np.save(tmp_path, np.zeros(0, dtype=dtype))
+    else:
+        source = np.memmap(raw_path, dtype=dtype, mode="r")
+        target = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(count,))
+        for start in range(0, count, _COPY_CHUNK):
+            target[start:start + _COPY_CHUNK] = source[start:start + _COPY_CHUNK]
+        target.flush()
+        del source, target
+    os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+
+
+# Streams strings to <name>.bin and their end offsets to <name>_offsets.npy
+class _StringsWriter:
+    def __init__(self, directory, name, work_dir):
+        self.directory = directory
+        self.name = name
+        self._data_path = os.path.join(directory, f"{name}.tmp.bin")
+        self._offsets_path = os.path.join(work_dir, f"{name}_offsets.raw")
+        self._data = open(self._data_path, "wb")
+        self._offsets = open(self._offsets_path, "wb")
+        self._position = 0
+        self._offsets.write(struct.pack("=Q", 0))
+
+    def append(self, raw):
+        self._data.write(raw)
+        self._position += len(raw)
+        self._offsets.write(struct.pack("=Q", self._position))
+
+    def close(self):
+        self._data.close()
+        self._offsets.close()
+        os.replace(self._data_path, os.path.join(self.directory, f"{self.name}.bin"))
+        _write_array_from_raw(self.directory, f"{self.name}_offsets", self._offsets_path, np.uint64)
+
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Sorted, memory-mapped table of normalized synonyms and their CIDs. Exact
+# and prefix lookups are binary searches over the mapped files, so a
+# multi-million entry index opens instantly and costs only the pages touched.
+class SynonymIndex:
+    def __init__(self, keys, key_offsets, names, name_offsets, cids):
+        self._keys = keys
+        self._key_offsets = key_offsets
+        self._names = names
+        self._name_offsets = name_offsets
+        self._cids = cids
+
+    def __len__(self):
+        return len(self._cids)
+
+    def _key(self, i):
+        return self._keys[int(self._key_offsets[i]):int(self._key_offsets[i + 1])]
+
+    def _name(self, i):
+        return self._names[int(self._name_offsets[i]):int(self._name_offsets[i + 1])].decode("utf-8")
+
+    # First row whose key is not less than the given one
+    def _lower_bound(self, key):
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # CID for an exact (normalized) synonym, or None
+    def lookup(self, name):
+        key = normalize_query(name).encode("utf-8")
+        row = self._lower_bound(key)
+        if row < len(self) and self._key(row) == key:
+            return int(self._cids[row])
+        return None
+
+    # Synonyms starting with the prefix, shortest first, one per compound
+    def complete(self, prefix, limit=10):
+        key = normalize_query(prefix).encode("utf-8")
+        if not key:
+            return []
+
+        candidates = []
+        row = self._lower_bound(key)
+        while row < len(self) and len(candidates) < COMPLETION_SCAN and self._key(row).startswith(key):
+            candidates.append((len(self._key(row)), self._name(row), int(self._cids[row])))
+            row += 1
+
+        matches = []
+        seen = set()
+        for _, name, cid in sorted(candidates):
+            if cid not in seen:
+                seen.add(cid)
+                matches.append({'name': name, 'cid': cid})
+            if len(matches) == limit:
+                break
+        return matches
+
+    # Build an index from (cid, synonym) pairs with an external sort: sorted
+    # chunks are spilled to disk and merged, and the tables are written as the
+    # merge streams past. A synonym shared by several compounds maps to the
+    # lowest CID, which is PubChem's preferred record.
+    @staticmethod
+    def build(pairs, directory=SYNONYM_INDEX_DIR, max_length=MAX_SYNONYM_LENGTH,
+              chunk_size=BUILD_CHUNK_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="build-", dir=directory)
+        try:
+            records = _sorted_records(pairs, work_dir, max_length, chunk_size)
+            keys = _StringsWriter(directory, "keys", work_dir)
+            names = _StringsWriter(directory, "names", work_dir)
+            cids_path = os.path.join(work_dir, "cids.raw")
+            count = 0
+            with open(cids_path, "wb") as cids:
+                # Records of one key arrive lowest CID first
+                for key, group in groupby(records, key=lambda record: record[0]):
+                    _, cid, synonym = next(group)
+                    keys.append(key)
+                    names.append(synonym.encode("utf-8"))
+                    cids.write(struct.pack("=q", cid))
+                    count += 1
+            keys.close()
+            names.close()
+            _write_array_from_raw(directory, "cids", cids_path, np.int64)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        # Written last: an index is only loaded once its meta file exists
+        tmp_path = os.path.join(directory, "meta.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump({'entries': count, 'max_length': max_length}, f)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+        return count
+
+    # Map a built index, or return None when there is none
+    @classmethod
+    def load(cls, directory=SYNONYM_INDEX_DIR):
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            return None
+        return cls(
+            _map_file(os.path.join(directory, "keys.bin")),
+            np.load(os.path.join(directory, "keys_offsets.npy"), mmap_mode="r"),
+            _map_file(os.path.join(directory, "names.bin")),
+            np.load(os.path.join(directory, "names_offsets.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "cids.npy"), mmap_mode="r"),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local synonym-to-CID index from a PubChem dump")
+    parser.add_argument("dump", help="CID-Synonym-filtered(.gz) from PubChem's FTP Compound/Extras")
+    parser.add_argument("--output", default=SYNONYM_INDEX_DIR)
+    parser.add_argument("--max-length", type=int, default=MAX_SYNONYM_LENGTH)
+    parser.add_argument("--chunk-size", type=int, default=BUILD_CHUNK_SIZE,
+                        help="synonyms sorted in memory at once; lower it to use less RAM")
+    args = parser.parse_args()
+
+    count = SynonymIndex.build(read_dump(args.dump), args.output, args.max_length, args.chunk_size)
+    print(f"Indexed {count} synonyms into {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import sqlite3
+import time
+
+import pytest
+import requests
+
+import pubchem
+from pubchem import CircuitBreaker, RateLimiter, SharedRateLimiter, UpstreamUnavailable
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+# Session returning the given responses in turn; an exception is raised instead
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, data=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class FailingLimiter:
+    def acquire(self):
+        raise sqlite3.OperationalError("database is locked")
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(pubchem, "breaker", breaker)
+    monkeypatch.setattr(pubchem, "rate_limiter", RateLimiter(1000))
+    return breaker
+
+
+def use_session(monkeypatch, *responses):
+    session = FakeSession(*responses)
+    monkeypatch.setattr(pubchem, "get_session", lambda: session)
+    return session
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_breaker_lets_one_trial_through_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+    for _ in range(5):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.reset_timeout = 60
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+def test_request_rejected_while_breaker_open(breaker, monkeypatch):
+    session = use_session(monkeypatch)
+    breaker.record_failure()
+    breaker.record_failure()
+    with pytest.raises(UpstreamUnavailable):
+        pubchem._request("GET", "http://pubchem.test/x", timeout=1)
+    assert session.calls == 0
+
+
+def test_trial_failing_in_rate_limiter_does_not_leave_breaker_half_open(breaker, monkeypatch):
+    breaker.failure_threshold = 1
+    breaker.reset_timeout = 0
+    breaker.record_failure()
+    monkeypatch.setattr(pubchem, "rate_limiter", FailingLimiter())
+
+    with pytest.raises(sqlite3.OperationalError):
+        pubchem._request("GET", "http://pubchem.test/x", timeout=1)
+
+    # The trial has ended, so another one is allowed
+    assert breaker.allow()
+
+
+def test_connection_error_counts_as_failure(breaker, monkeypatch):
+    use_session(monkeypatch, requests.ConnectionError("refused"))
+    with pytest.raises(requests.ConnectionError):
+        pubchem._request("GET", "http://pubchem.test/x", timeout=1)
+    assert breaker.failures == 1
+
+
+def test_throttled_response_is_retried_after_retry_after(breaker, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(pubchem.time, "sleep", sleeps.append)
+    session = use_session(monkeypatch, FakeResponse(429, {"Retry-After": "2"}), FakeResponse(200))
+
+    response = pubchem._request("GET", "http://pubchem.test/x", timeout=10)
+
+    assert response.status_code == 200
+    assert session.calls == 2
+    assert sleeps == [2.0]
+    assert breaker.failures == 0
+
+
+def test_retries_stop_at_max_retries(breaker, monkeypatch):
+    monkeypatch.setattr(pubchem.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(pubchem, "MAX_RETRIES", 2)
+    session = use_session(monkeypatch, *[FakeResponse(503) for _ in range(3)])
+
+    response = pubchem._request("GET", "http://pubchem.test/x", timeout=10)
+
+    assert response.status_code == 503
+    assert session.calls == 3
+    assert breaker.failures == 1
+
+
+def test_not_found_counts_as_healthy(breaker, monkeypatch):
+    breaker.record_failure()
+    use_session(monkeypatch, FakeResponse(404))
+    assert pubchem._request("GET", "http://pubchem.test/x", timeout=1).status_code == 404
+    assert breaker.failures == 0
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        assert 0 <= pubchem._backoff_delay(attempt, FakeResponse(503)) <= pubchem.BACKOFF_MAX
+    assert pubchem._backoff_delay(0, FakeResponse(429, {"Retry-After": "600"})) == pubchem.BACKOFF_MAX
+
+
+def test_rate_limiter_waits_once_burst_is_spent():
+    limiter = RateLimiter(rate=20, burst=1)
+    limiter.acquire()
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.03
+
+
+def test_shared_rate_limiter_shares_one_bucket(tmp_path):
+    path = str(tmp_path / "rate.sqlite3")
+    first = SharedRateLimiter(path, rate=1, burst=1)
+    second = SharedRateLimiter(path, rate=1, burst=1)
+
+    assert first._take() == 0
+    assert second._take() > 0
+
+
+def test_shared_rate_limiter_falls_back_when_file_is_unusable(tmp_path):
+    limiter = SharedRateLimiter(str(tmp_path / "missing" / "rate.sqlite3"), rate=1000)
+    limiter.acquire()
+
+
+# Session answering by URL, recording which URLs were requested
+class UrlSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+
+    def request(self, method, url, data=None, timeout=None):
+        self.urls.append(url)
+        return self.responses[url]
+
+
+def test_known_cid_fetches_record_and_sdf_together(breaker, monkeypatch):
+    record = FakeResponse(200)
+    record.json = lambda: {'PC_Compounds': [{'cid': 2244}]}
+    sdf = FakeResponse(200)
+    sdf.text = "sdf block"
+    session = UrlSession({pubchem.compound_cid_url(2244): record, pubchem.sdf_url(2244): sdf})
+    monkeypatch.setattr(pubchem, "get_session", lambda: session)
+    monkeypatch.setattr(pubchem, "flights", pubchem.SingleFlight())
+    monkeypatch.setattr(pubchem.pcp, "Compound", lambda data: data)
+    monkeypatch.setattr(pubchem, "compound_to_data", lambda compound: {'cid': compound['cid']})
+
+    calls = []
+    fetch_all = pubchem.fetch_all
+    monkeypatch.setattr(pubchem, "fetch_all", lambda urls, deadline=None: calls.append(set(urls)) or fetch_all(urls, deadline))
+
+    data = pubchem.fetch_molecule_data("aspirin", cid=2244)
+
+    assert data == {'cid': 2244, 'sdf': "sdf block", 'fetch_errors': {}}
+    assert calls == [{'record', 'sdf'}]
+    assert sorted(session.urls) == sorted([pubchem.compound_cid_url(2244), pubchem.sdf_url(2244)])
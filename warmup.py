@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import MoleculeService
+
+# The Quick Access buttons on the search tab
+QUICK_ACCESS = ["aspirin", "caffeine", "glucose", "water", "ethanol"]
+
+TOP_N = int(os.getenv("WARMUP_TOP_N", 20))
+CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 4))
+
+
+# Quick Access names first, then the most searched queries, without repeats
+def warmup_queries(pool=None, top_n=TOP_N, extra=()):
+    queries = list(QUICK_ACCESS) + list(extra)
+    if pool is not None and top_n:
+        import db
+
+        try:
+            queries += [row['compound_name'] for row in db.popular_compounds(pool, top_n)]
+        except Exception:
+            pass
+
+    seen = set()
+    unique = []
+    for query in queries:
+        key = query.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(query)
+    return unique
+
+
+# Make the calls a search makes, through the same service, so every layer
+# it reads is filled: the record with its SDF, both pictures and the basic
+# descriptors, in the compound cache, the depiction cache and the payload store
+def warm_compound(name, service):
+    data = service.lookup(name)
+    if not data:
+        return 'not found'
+    if data.get('fetch_errors'):
+        return 'partial'
+
+    service.image(data['cid'], '2d', data['smiles'], data.get('sdf'))
+    service.image(data['cid'], '3d', data['smiles'], data.get('sdf'))
+    if data['smiles'] != 'N/A':
+        service.describe(data['smiles'])
+    return 'ok'
+
+
+# Warm every query with bounded concurrency. PubChem traffic is additionally
+# held to the shared rate limit. Returns {query: status}.
+def run(queries, service=None, concurrency=CONCURRENCY):
+    service = service or MoleculeService.from_env()
+
+    def warm(name):
+        try:
+            return name, warm_compound(name, service)
+        except Exception as e:
+            return name, f"error: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return dict(executor.map(warm, queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-populate the compound, depiction and payload caches")
+    parser.add_argument("queries", nargs="*", help="extra names to warm besides Quick Access and history")
+    parser.add_argument("--top", type=int, default=TOP_N, help="most searched history queries to include")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    pool = None
+    if os.getenv("DB_URL"):
+        from db import ConnectionPool
+
+        pool = ConnectionPool.from_env()
+
+    queries = warmup_queries(pool, args.top, args.queries)
+    start = time.perf_counter()
+    results = run(queries, MoleculeService.from_env(), concurrency=args.concurrency)
+    for query, status in results.items():
+        print(f"{query:30} {status}")
+    print(f"Warmed {sum(status == 'ok' for status in results.values())} of {len(results)} "
+          f"compounds in {time.perf_counter() - start:.1f}s")
+    return 1 if any(status.startswith('error') for status in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())